@@ -0,0 +1,224 @@
+"""Times the main operations of the bureaucrat on synthetic measurement
+trees and compares them with a baseline, to notice speed regressions
+before they show up in real measurements. It always uses the 
+`bureaucrat` of the repository in which it is, not an installed one,
+so it can be run from a checkout without installing it. Usage:
+```
+python benchmarks/benchmark_bureaucrat.py --save-baseline # Run this before your changes...
+python benchmarks/benchmark_bureaucrat.py # ...and this after them.
+```
+Use `--sizes 10 1000 100000` to choose the number of submeasurements of
+the trees and `--depth` for how many levels they have. The baseline is
+only meaningful on the same computer in which it was created.
+"""
+
+from pathlib import Path
+import sys
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent)) # The changes we want to benchmark are in this repository.
+from bureaucrat.SmarterBureaucrat import NamedTaskBureaucrat, RUN_RECORD_FILE_NAME, ERRORS_REPORT_FILE_NAME, tasks_were_applied_without_errors
+import tempfile
+import argparse
+import platform
+import datetime
+import statistics
+import time
+import json
+import math
+import os
+
+PATH_TO_DEFAULT_BASELINE = Path(__file__).parent/Path('baseline.json')
+
+# The states in which the task `measure` is left in the submeasurements, cycling through them ---
+STATES = ['no errors', 'there were errors', 'legacy errors report', 'legacy flag', 'not run']
+
+def make_synthetic_tree(path:Path, n_submeasurements:int, depth:int):
+	"""Creates the directories and files of a measurement tree as the
+	bureaucrats would, but much faster, with `n_submeasurements` in
+	total distributed in `depth` levels. Each measurement with
+	submeasurements has a task `sweep` that created them and each
+	measurement has a task `measure` in one of the `STATES`. The top
+	level measurement also has a task `legacy_measure` as left by the
+	older bureaucrats, i.e. without run record, with `n_submeasurements`
+	files in its output directory."""
+	width = max(1, math.ceil(n_submeasurements**(1/depth)))
+	def leave_task(path_to_output_directory:Path, state:str):
+		if state == 'not run':
+			return
+		path_to_output_directory.mkdir(parents=True, exist_ok=True)
+		if state in {'no errors', 'there were errors'}:
+			with open(path_to_output_directory/Path(RUN_RECORD_FILE_NAME), 'w') as ofile:
+				json.dump({'format_version': 1, 'run_status': state}, ofile)
+		elif state == 'legacy errors report':
+			with open(path_to_output_directory/Path(ERRORS_REPORT_FILE_NAME), 'w') as ofile:
+				print('run_status: no errors', file=ofile)
+		elif state == 'legacy flag':
+			(path_to_output_directory/Path('script_successfully_applied')).touch()
+	path.mkdir()
+	leave_task(path/Path('measure'), STATES[0])
+	leave_task(path/Path('legacy_measure'), 'legacy errors report')
+	for n in range(n_submeasurements):
+		(path/Path('legacy_measure')/Path(f'file_{n}')).touch()
+	n_created = 0
+	level = [path]
+	while n_created < n_submeasurements:
+		next_level = []
+		for parent in level:
+			if n_created >= n_submeasurements:
+				break
+			n_children = min(width, n_submeasurements - n_created)
+			(parent/Path('sweep')/Path('submeasurements')).mkdir(parents=True)
+			leave_task(parent/Path('sweep'), 'no errors')
+			for n_child in range(n_children):
+				child = parent/Path('sweep')/Path('submeasurements')/Path(f'submeasurement_{n_created}')
+				child.mkdir()
+				leave_task(child/Path('measure'), STATES[n_created % len(STATES)])
+				next_level.append(child)
+				n_created += 1
+		level = next_level
+
+def time_it(function, repetitions:int) -> float:
+	"""Runs `function` `repetitions` times and returns the median of the
+	time it took, in seconds."""
+	times = []
+	for _ in range(repetitions):
+		start = time.perf_counter()
+		function()
+		times.append(time.perf_counter() - start)
+	return statistics.median(times)
+
+def benchmark_tree(path:Path, repetitions:int) -> dict:
+	"""Times the main operations on the tree in `path`, created by
+	`make_synthetic_tree`, and returns a dictionary with the times."""
+	def new_bureaucrat(task_name='benchmark', deduplicate_script_backup=False):
+		return NamedTaskBureaucrat(path, task_name=task_name, _locals={'a_local_variable': 1}, deduplicate_script_backup=deduplicate_script_backup)
+	def enter_and_exit():
+		with new_bureaucrat().do_your_magic():
+			pass
+	def run_with_legacy_upstream():
+		John = new_bureaucrat('with_legacy_upstream')
+		John.check_required_tasks_were_run_before('legacy_measure')
+		with John.do_your_magic():
+			pass
+	def submeasurements(created_by_parent:bool, batch_index_writes:bool=False, n_submeasurements:int=100):
+		# Time per submeasurement created and run inside the magic of a parent.
+		John = new_bureaucrat('sweep_benchmark')
+		with John.do_your_magic():
+			start = time.perf_counter()
+			for k in range(n_submeasurements):
+				if created_by_parent:
+					Rick = John.create_submeasurement(f'submeasurement_{k}', task_name='measure', _locals={'k': k}, batch_index_writes=batch_index_writes)
+				else:
+					Rick = NamedTaskBureaucrat(John.path_to_submeasurements_directory/Path(f'submeasurement_{k}'), task_name='measure', _locals={'k': k}, new_measurement=True)
+				with Rick.do_your_magic():
+					pass
+			return (time.perf_counter() - start)/n_submeasurements
+	def clean():
+		John = new_bureaucrat()
+		John.path_to_default_output_directory.mkdir(exist_ok=True)
+		for n in range(100):
+			(John.path_to_default_output_directory/Path(f'file_{n}')).touch()
+		start = time.perf_counter()
+		John.clean_default_output_directory()
+		return time.perf_counter() - start
+	def backup(deduplicated:bool):
+		John = new_bureaucrat(deduplicate_script_backup=deduplicated)
+		with John.do_your_magic():
+			path_to_backup = John.path_to_default_output_directory/Path(John._backup_script_file_name)
+			if deduplicated:
+				path_to_backup.unlink() # Linked already when entering the magic, it has to be linked again into an empty place.
+			start = time.perf_counter()
+			if deduplicated:
+				John._link_deduplicated_backup_of_calling_script_file()
+			else:
+				John._make_backup_of_calling_script_file(John.path_to_default_output_directory/Path('backup.py'))
+			elapsed = time.perf_counter() - start
+			if deduplicated and not path_to_backup.is_file(): # Otherwise we measured the pointer file, not the hard link.
+				raise RuntimeError(f'The deduplicated backup was not linked into {path_to_backup}.')
+			return elapsed
+	
+	results = dict()
+	results['construction'] = time_it(new_bureaucrat, repetitions)
+	results['do_your_magic enter/exit'] = time_it(enter_and_exit, repetitions)
+	results['find_all_submeasurements without index'] = time_it(lambda: new_bureaucrat().find_all_submeasurements(), repetitions)
+	results['check_required_tasks_were_run_before without index'] = time_it(lambda: new_bureaucrat().check_required_tasks_were_run_before('sweep'), repetitions)
+	results['check_required_tasks_were_run_before on a legacy upstream'] = time_it(lambda: new_bureaucrat().check_required_tasks_were_run_before('legacy_measure'), repetitions)
+	run_with_legacy_upstream()
+	results['is_up_to_date with a legacy upstream'] = time_it(lambda: new_bureaucrat('with_legacy_upstream').is_up_to_date(), repetitions)
+	all_measurements = [path] + [p for p in path.rglob('submeasurement_*') if p.parent.name == 'submeasurements']
+	results['tasks_were_applied_without_errors on all the tree without index'] = time_it(lambda: tasks_were_applied_without_errors(all_measurements, ['measure']), repetitions)
+	results['rebuild_index'] = time_it(lambda: new_bureaucrat().rebuild_index(), 1)
+	results['find_all_submeasurements with index'] = time_it(lambda: new_bureaucrat().find_all_submeasurements(), repetitions)
+	results['check_required_tasks_were_run_before with index'] = time_it(lambda: new_bureaucrat().check_required_tasks_were_run_before('sweep'), repetitions)
+	results['tasks_were_applied_without_errors on all the tree with index'] = time_it(lambda: tasks_were_applied_without_errors(all_measurements, ['measure']), repetitions)
+	results['new NamedTaskBureaucrat submeasurement enter/exit'] = statistics.median([submeasurements(created_by_parent=False) for _ in range(repetitions)])
+	results['create_submeasurement enter/exit'] = statistics.median([submeasurements(created_by_parent=True) for _ in range(repetitions)])
+	results['create_submeasurement enter/exit with batched index writes'] = statistics.median([submeasurements(created_by_parent=True, batch_index_writes=True) for _ in range(repetitions)])
+	results['clean_default_output_directory with 100 files'] = statistics.median([clean() for _ in range(repetitions)])
+	results['backup of the script'] = statistics.median([backup(deduplicated=False) for _ in range(repetitions)])
+	results['deduplicated backup of the script'] = statistics.median([backup(deduplicated=True) for _ in range(repetitions)])
+	return results
+
+def run_benchmarks(sizes:list, depth:int, repetitions:int) -> dict:
+	benchmarks = {
+		'environment': {
+			'when': str(datetime.datetime.now()),
+			'python': platform.python_version(),
+			'platform': platform.platform(),
+			'cpus': os.cpu_count(),
+			'depth': depth,
+			'repetitions': repetitions,
+		},
+		'results': dict(),
+	}
+	for n_submeasurements in sizes:
+		with tempfile.TemporaryDirectory() as temporary_directory:
+			path = Path(temporary_directory)/Path('synthetic_measurement')
+			print(f'Creating synthetic tree with {n_submeasurements} submeasurements...')
+			make_synthetic_tree(path, n_submeasurements=n_submeasurements, depth=depth)
+			print(f'Benchmarking...')
+			benchmarks['results'][str(n_submeasurements)] = benchmark_tree(path, repetitions=repetitions)
+	return benchmarks
+
+def compare_with_baseline(benchmarks:dict, baseline:dict, tolerance:float, min_difference:float) -> bool:
+	"""Prints the comparison and returns `True` if nothing is slower than
+	`tolerance` times the baseline. Differences smaller than `min_difference`
+	seconds are considered noise."""
+	everything_ok = True
+	for size, results in benchmarks['results'].items():
+		print(f'\n{size} submeasurements')
+		for operation, seconds in results.items():
+			baseline_seconds = baseline['results'].get(size, dict()).get(operation)
+			if baseline_seconds is None:
+				print(f'\t{operation}: {seconds*1e3:.3f} ms (not in the baseline)')
+				continue
+			ratio = seconds/baseline_seconds if baseline_seconds > 0 else float('inf')
+			is_slower = ratio > tolerance and seconds - baseline_seconds > min_difference
+			everything_ok = everything_ok and not is_slower
+			print(f'\t{operation}: {seconds*1e3:.3f} ms, baseline {baseline_seconds*1e3:.3f} ms, x{ratio:.2f}{" <-- SLOWER" if is_slower else ""}')
+	return everything_ok
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Benchmarks the bureaucrat on synthetic measurement trees.')
+	parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 10000], help='Numbers of submeasurements of the trees.')
+	parser.add_argument('--depth', type=int, default=2, help='Number of levels of submeasurements of the trees.')
+	parser.add_argument('--repetitions', type=int, default=5, help='Each operation is timed this number of times and the median is kept.')
+	parser.add_argument('--baseline', type=Path, default=PATH_TO_DEFAULT_BASELINE, help='Path to the baseline file.')
+	parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline instead of comparing with it.')
+	parser.add_argument('--tolerance', type=float, default=1.5, help='Operations that take more than this times the baseline are reported as slower, and the exit code is 1.')
+	parser.add_argument('--min-difference', type=float, default=1e-3, help='Operations that are slower by less than this number of seconds are not reported as slower, as this is usually noise.')
+	args = parser.parse_args()
+	
+	benchmarks = run_benchmarks(sizes=args.sizes, depth=args.depth, repetitions=args.repetitions)
+	if args.save_baseline:
+		with open(args.baseline, 'w') as ofile:
+			json.dump(benchmarks, ofile, indent='\t')
+		print(f'Baseline stored in {args.baseline}')
+	else:
+		try:
+			with open(args.baseline, 'r') as ifile:
+				baseline = json.load(ifile)
+		except FileNotFoundError:
+			print(f'There is no baseline in {args.baseline}, run with `--save-baseline` first.')
+			sys.exit(1)
+		if not compare_with_baseline(benchmarks, baseline, tolerance=args.tolerance, min_difference=args.min_difference):
+			sys.exit(1)
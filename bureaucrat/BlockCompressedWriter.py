@@ -0,0 +1,198 @@
+from pathlib import Path
+import io
+import os
+import gzip
+import bz2
+import lzma
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+# Extension and first bytes of the files of each compression ---
+COMPRESSIONS = {
+	'gzip': {'extension': '.gz', 'magic': b'\x1f\x8b'},
+	'bz2': {'extension': '.bz2', 'magic': b'BZh'},
+	'lzma': {'extension': '.xz', 'magic': b'\xfd7zXZ\x00'},
+	'zstd': {'extension': '.zst', 'magic': b'\x28\xb5\x2f\xfd'}, # Needs the `zstandard` package.
+}
+
+def _compress_function(compression:str, level:int):
+	"""Returns a function that compresses a block of bytes into a complete
+	compressed stream, so the blocks can be compressed independently
+	and concatenated."""
+	if compression == 'gzip':
+		return lambda data: gzip.compress(data, compresslevel=6 if level is None else level, mtime=0)
+	if compression == 'bz2':
+		return lambda data: bz2.compress(data, compresslevel=9 if level is None else level)
+	if compression == 'lzma':
+		return lambda data: lzma.compress(data, preset=level)
+	if compression == 'zstd':
+		import zstandard # Optional, only needed for this.
+		return lambda data: zstandard.ZstdCompressor(level=3 if level is None else level).compress(data)
+	raise ValueError(f'`compression` must be one of {sorted(COMPRESSIONS)}, received {repr(compression)}.')
+
+class BlockCompressedWriter(io.RawIOBase):
+	"""A binary file that compresses what is written into it in blocks,
+	each of them compressed independently by a pool of threads, so big
+	files are written almost as fast as without compression. Each block
+	is a complete gzip (or bz2, or xz, or zstd) stream and the result is
+	their concatenation, which is a valid compressed file that can be
+	read by the usual tools, e.g. `gzip.open` or `gunzip`.
+	
+	Usually you get it from a bureaucrat, see `open_output`.
+	"""
+	def __init__(self, fpath:Path, compression:str='gzip', level:int=None, block_size:int=2**22, max_workers:int=None):
+		"""Create an instance of `BlockCompressedWriter`.
+		
+		Parameters
+		----------
+		fpath: Path
+			Path to the file to create.
+		compression: str, default `'gzip'`
+			One of `'gzip'`, `'bz2'`, `'lzma'` or `'zstd'` (this one needs
+			the `zstandard` package).
+		level: int, optional
+			Compression level, the meaning depends on `compression`.
+		block_size: int, default 4 MiB
+			Number of bytes of each block.
+		max_workers: int, optional
+			Number of threads, by default the number of CPUs.
+		"""
+		super().__init__()
+		self._compress = _compress_function(compression, level)
+		self._block_size = block_size
+		self._buffer = bytearray()
+		self._executor = ThreadPoolExecutor(max_workers=max_workers)
+		self._max_pending_blocks = 2*(max_workers or os.cpu_count() or 1) # So the memory used is bounded.
+		self._pending_blocks = collections.deque()
+		self._anything_written = False
+		self._file = open(fpath, 'wb')
+	
+	def writable(self):
+		return True
+	
+	def write(self, b):
+		self._check_is_open()
+		self._buffer += b
+		while len(self._buffer) >= self._block_size:
+			self._submit(bytes(self._buffer[:self._block_size]))
+			del self._buffer[:self._block_size]
+		return len(b)
+	
+	def _check_is_open(self):
+		if self.closed:
+			raise ValueError('I/O operation on closed file.')
+	
+	def _submit(self, block:bytes):
+		self._anything_written = True
+		self._pending_blocks.append(self._executor.submit(self._compress, block))
+		while len(self._pending_blocks) > self._max_pending_blocks:
+			self._file.write(self._pending_blocks.popleft().result())
+	
+	def close(self):
+		if self.closed:
+			return
+		try:
+			if len(self._buffer) > 0 or not self._anything_written: # An empty file still has to be a valid compressed file.
+				self._submit(bytes(self._buffer))
+				self._buffer = bytearray()
+			while len(self._pending_blocks) > 0:
+				self._file.write(self._pending_blocks.popleft().result())
+		finally:
+			self._executor.shutdown()
+			self._file.close()
+			super().close()
+
+def open_compressed_for_writing(fpath:Path, mode:str='w', compression:str='gzip', level:int=None, block_size:int=2**22, max_workers:int=None, encoding:str=None):
+	"""Opens `fpath` for writing in a `BlockCompressedWriter`. If `mode`
+	is `'w'` or `'wt'` it is a text file, if `'wb'` a binary file."""
+	if mode not in {'w', 'wt', 'wb'}:
+		raise ValueError(f'`mode` must be one of `"w"`, `"wt"` or `"wb"`, received {repr(mode)}.')
+	binary = io.BufferedWriter(BlockCompressedWriter(fpath, compression=compression, level=level, block_size=block_size, max_workers=max_workers), buffer_size=block_size)
+	if mode == 'wb':
+		return binary
+	return io.TextIOWrapper(binary, encoding=encoding)
+
+def detect_compression(fpath:Path) -> str:
+	"""Returns the compression of `fpath` looking at its first bytes, or
+	`None` if it is not compressed (or compressed with something we do
+	not know)."""
+	with fpath.open('rb') as ifile: # Not `open(fpath)`, so it also works with paths within archives, see `MeasurementArchive`.
+		first_bytes = ifile.read(max(len(c['magic']) for c in COMPRESSIONS.values()))
+	for compression, c in COMPRESSIONS.items():
+		if first_bytes.startswith(c['magic']):
+			return compression
+	return None
+
+def open_compressed_for_reading(fpath:Path, mode:str='r', encoding:str=None):
+	"""Opens `fpath` for reading, decompressing it if it is compressed
+	with any of the `COMPRESSIONS`, which is detected automatically. If
+	`fpath` does not exist but `fpath` with the extension of any of the
+	`COMPRESSIONS` exists (e.g. `data.txt.gz` for `data.txt`), that one
+	is opened. If `mode` is `'r'` or `'rt'` it is a text file, if `'rb'`
+	a binary file."""
+	if mode not in {'r', 'rt', 'rb'}:
+		raise ValueError(f'`mode` must be one of `"r"`, `"rt"` or `"rb"`, received {repr(mode)}.')
+	if not fpath.exists():
+		for c in COMPRESSIONS.values():
+			if (fpath.parent/Path(fpath.name + c['extension'])).exists():
+				fpath = fpath.parent/Path(fpath.name + c['extension'])
+				break
+		else:
+			raise FileNotFoundError(f'No such file: {fpath}')
+	compression = detect_compression(fpath)
+	raw = fpath.open('rb')
+	if compression == 'gzip':
+		binary = gzip.GzipFile(fileobj=raw, mode='rb')
+	elif compression == 'bz2':
+		binary = bz2.BZ2File(raw, mode='rb')
+	elif compression == 'lzma':
+		binary = lzma.LZMAFile(raw, mode='rb')
+	elif compression == 'zstd':
+		import zstandard # Optional, only needed for this.
+		binary = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True))
+	else:
+		binary = raw
+	if binary is not raw and compression != 'zstd':
+		binary = _DecompressedFile(binary, raw)
+	if mode == 'rb':
+		return binary
+	return io.TextIOWrapper(binary, encoding=encoding)
+
+class _DecompressedFile(io.BufferedIOBase):
+	"""`gzip.GzipFile` and friends do not close the file they receive, this
+	closes it. It is not a `io.BufferedReader` because e.g. NumPy would
+	think it is a real file and read from its file descriptor."""
+	def __init__(self, decompressed, raw):
+		super().__init__()
+		self._decompressed = decompressed
+		self._raw_file = raw
+	
+	def readable(self):
+		return True
+	
+	def seekable(self):
+		return self._decompressed.seekable()
+	
+	def read(self, size=-1):
+		return self._decompressed.read(size)
+	
+	def read1(self, size=-1):
+		return self._decompressed.read1(size)
+	
+	def readinto(self, b):
+		return self._decompressed.readinto(b)
+	
+	def seek(self, offset, whence=io.SEEK_SET):
+		return self._decompressed.seek(offset, whence)
+	
+	def tell(self):
+		return self._decompressed.tell()
+	
+	def close(self):
+		if self.closed:
+			return
+		try:
+			self._decompressed.close()
+		finally:
+			self._raw_file.close()
+			super().close()
@@ -0,0 +1,357 @@
+from pathlib import Path
+import struct
+import zlib
+import json
+import io
+import time
+import queue
+import threading
+import mmap
+import os
+
+MAGIC = b'BCK1'
+HEADER = struct.Struct('<4scQI') # Magic, kind of chunk, length of the payload, CRC32 of the payload.
+RECORDS_CHUNK = b'r' # Payload is JSON lines, one record per line.
+ARRAY_CHUNK = b'a' # Payload is a NumPy array in `.npy` format.
+FOOTER_CHUNK = b'f' # Payload is JSON with the number of chunks, records and arrays, written when the file is closed.
+
+class ChunkedWriter:
+	"""Writes records (anything that can be stored as JSON, e.g. a dict
+	with the values measured in one iteration) and NumPy arrays into a
+	file, in chunks, while they are produced. This way you do not need to
+	keep all the data in memory until the end, and if the script crashes
+	everything up to the last chunk is on disk. Use `read_chunked` to
+	read the file.
+	
+	Each chunk has a small header with its length and checksum, and a
+	footer is written when the writer is closed, so incomplete or
+	corrupted files are detected by `validate_chunked`.
+	
+	Usually you get it from a bureaucrat, which closes it for you:
+	```
+	with John.do_your_magic():
+		writer = John.chunked_writer('measured_data')
+		for k in range(99999):
+			writer.append({'n_measurement': k, 'voltage': measure_voltage()})
+	```
+	"""
+	def __init__(self, fpath:Path, max_records_per_chunk:int=1000, max_bytes_per_chunk:int=2**24, flush_period:float=10, background:bool=False, max_pending_chunks:int=10):
+		"""Create an instance of `ChunkedWriter`.
+		
+		Parameters
+		----------
+		fpath: Path
+			Path to the file, it must not exist.
+		max_records_per_chunk: int, default 1000
+			Records are kept in memory until there are this many of them,
+			then they are written as one chunk.
+		max_bytes_per_chunk: int, default 16 MiB
+			Same as `max_records_per_chunk` but for the size of the records.
+		flush_period: float, default 10
+			Records are not kept in memory for more than this number of
+			seconds, so not much is lost if the script crashes.
+		background: bool, default `False`
+			If `True` the chunks are written by a background thread, so
+			`append` does not wait for the disk.
+		max_pending_chunks: int, default 10
+			When `background` is `True`, `append` waits if there are this
+			many chunks waiting to be written, so the memory used is bounded.
+		"""
+		if not isinstance(fpath, Path):
+			raise TypeError(f'`fpath` must be an instance of {Path}, received object of type {type(fpath)}.')
+		self._fpath = fpath
+		self._file = open(fpath, 'xb')
+		self._max_records_per_chunk = max_records_per_chunk
+		self._max_bytes_per_chunk = max_bytes_per_chunk
+		self._flush_period = flush_period
+		self._buffer = []
+		self._buffer_size = 0
+		self._last_flush = time.monotonic()
+		self._counts = {'chunks': 0, 'records': 0, 'arrays': 0}
+		self._closed = False
+		self._background_error = None
+		if background == True:
+			self._queue = queue.Queue(maxsize=max_pending_chunks)
+			self._writer_thread = threading.Thread(target=self._write_chunks_from_queue, daemon=True)
+			self._writer_thread.start()
+	
+	@property
+	def path(self) -> Path:
+		"""Path to the file."""
+		return self._fpath
+	
+	def append(self, record):
+		"""Appends a record, which can be anything that can be stored as
+		JSON, e.g. a dictionary with numbers and strings."""
+		self._check_is_open()
+		line = (json.dumps(record) + '\n').encode()
+		self._buffer.append(line)
+		self._buffer_size += len(line)
+		self._counts['records'] += 1
+		if len(self._buffer) >= self._max_records_per_chunk or self._buffer_size >= self._max_bytes_per_chunk or time.monotonic() - self._last_flush > self._flush_period:
+			self.flush()
+	
+	def append_array(self, array):
+		"""Appends a NumPy array, which is written right away as a chunk
+		of its own (after the records appended before it)."""
+		self._check_is_open()
+		import numpy # Only needed if you use arrays.
+		self.flush()
+		payload = io.BytesIO()
+		numpy.lib.format.write_array(payload, numpy.asanyarray(array), allow_pickle=False)
+		self._counts['arrays'] += 1
+		self._put_chunk(ARRAY_CHUNK, payload.getvalue())
+	
+	def flush(self):
+		"""Writes the records kept in memory as a chunk."""
+		if len(self._buffer) > 0:
+			self._put_chunk(RECORDS_CHUNK, b''.join(self._buffer))
+			self._buffer = []
+			self._buffer_size = 0
+		self._last_flush = time.monotonic()
+	
+	def close(self):
+		"""Writes everything that is pending and the footer, closes the
+		file and validates it. Does nothing if it was already closed."""
+		if self._closed:
+			return
+		self.flush()
+		self._put_chunk(FOOTER_CHUNK, json.dumps({'chunks': self._counts['chunks'], 'records': self._counts['records'], 'arrays': self._counts['arrays']}).encode())
+		self._closed = True
+		if hasattr(self, '_queue'):
+			self._queue.put(None) # Tell the thread to finish.
+			self._writer_thread.join()
+		self._file.close()
+		if self._background_error is not None:
+			raise RuntimeError(f'Could not write {self.path}.') from self._background_error
+		validate_chunked(self.path)
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
+	
+	def _check_is_open(self):
+		if self._closed:
+			raise RuntimeError(f'The writer of {self.path} was already closed.')
+		if self._background_error is not None:
+			raise RuntimeError(f'Could not write {self.path}.') from self._background_error
+	
+	def _put_chunk(self, kind:bytes, payload:bytes):
+		if kind != FOOTER_CHUNK:
+			self._counts['chunks'] += 1
+		if hasattr(self, '_queue'):
+			self._queue.put((kind, payload))
+		else:
+			self._write_chunk(kind, payload)
+	
+	def _write_chunk(self, kind:bytes, payload:bytes):
+		self._file.write(HEADER.pack(MAGIC, kind, len(payload), zlib.crc32(payload)))
+		self._file.write(payload)
+		self._file.flush()
+	
+	def _write_chunks_from_queue(self):
+		while True:
+			chunk = self._queue.get()
+			if chunk is None:
+				return
+			if self._background_error is None: # After an error we keep consuming so `append` never blocks forever.
+				try:
+					self._write_chunk(*chunk)
+				except Exception as e:
+					self._background_error = e
+
+def _iter_chunks(fpath:Path):
+	"""Yields `(kind, offset_of_the_payload, payload)` for each chunk in
+	the file, raising `ValueError` if the file is corrupted."""
+	with open(fpath, 'rb') as ifile:
+		while True:
+			header = ifile.read(HEADER.size)
+			if len(header) == 0:
+				return
+			if len(header) < HEADER.size:
+				raise ValueError(f'{fpath} is truncated.')
+			magic, kind, length, crc32 = HEADER.unpack(header)
+			if magic != MAGIC:
+				raise ValueError(f'{fpath} is not a chunked file or it is corrupted.')
+			offset = ifile.tell()
+			payload = ifile.read(length)
+			if len(payload) < length:
+				raise ValueError(f'{fpath} is truncated.')
+			if zlib.crc32(payload) != crc32:
+				raise ValueError(f'Chunk at byte {offset} of {fpath} is corrupted.')
+			yield kind, offset, payload
+
+def validate_chunked(fpath:Path) -> dict:
+	"""Checks that the file written by a `ChunkedWriter` is complete and
+	not corrupted, raising `ValueError` otherwise. Returns a dictionary
+	with the number of chunks, records and arrays in it."""
+	counts = {'chunks': 0, 'records': 0, 'arrays': 0}
+	footer = None
+	for kind, offset, payload in _iter_chunks(fpath):
+		if footer is not None:
+			raise ValueError(f'{fpath} has data after the footer.')
+		if kind == FOOTER_CHUNK:
+			footer = json.loads(payload)
+			continue
+		counts['chunks'] += 1
+		if kind == RECORDS_CHUNK:
+			counts['records'] += payload.count(b'\n')
+		elif kind == ARRAY_CHUNK:
+			counts['arrays'] += 1
+		else:
+			raise ValueError(f'Unknown kind of chunk {kind} at byte {offset} of {fpath}.')
+	if footer is None:
+		raise ValueError(f'{fpath} has no footer, it was not closed properly (maybe the script crashed), but all the chunks in it are fine and can be read.')
+	if footer != counts:
+		raise ValueError(f'{fpath} says it contains {footer} but it contains {counts}.')
+	return counts
+
+def read_chunked(fpath:Path, ignore_missing_footer:bool=False):
+	"""Reads a file written by a `ChunkedWriter`, yielding the records
+	and arrays in the same order they were appended.
+	
+	Parameters
+	----------
+	fpath: Path
+		Path to the file.
+	ignore_missing_footer: bool, default `False`
+		If `True`, files that were not closed (e.g. because the script
+		crashed) are read up to the last complete chunk. Otherwise a
+		`ValueError` is raised at the end.
+	"""
+	footer_found = False
+	try:
+		for kind, offset, payload in _iter_chunks(fpath):
+			if kind == RECORDS_CHUNK:
+				for line in payload.splitlines():
+					yield json.loads(line)
+			elif kind == ARRAY_CHUNK:
+				import numpy # Only needed if there are arrays.
+				yield numpy.lib.format.read_array(io.BytesIO(payload), allow_pickle=False)
+			elif kind == FOOTER_CHUNK:
+				footer_found = True
+	except ValueError:
+		if not ignore_missing_footer:
+			raise
+		return
+	if not footer_found and not ignore_missing_footer:
+		raise ValueError(f'{fpath} has no footer, it was not closed properly (maybe the script crashed). Use `ignore_missing_footer=True` to read it anyway.')
+
+def _iter_chunk_headers(buffer, fpath:Path):
+	"""Like `_iter_chunks` but for a buffer (e.g. a memory map) and without
+	reading the payloads, yields `(kind, offset_of_the_payload, length_of_the_payload)`.
+	A chunk that is incomplete, as the last one of a file being written
+	when the script crashed, raises `ValueError`."""
+	position = 0
+	while position < len(buffer):
+		if len(buffer) - position < HEADER.size:
+			raise ValueError(f'{fpath} is truncated.')
+		magic, kind, length, crc32 = HEADER.unpack_from(buffer, position)
+		if magic != MAGIC:
+			raise ValueError(f'{fpath} is not a chunked file or it is corrupted.')
+		position += HEADER.size
+		if position + length > len(buffer):
+			raise ValueError(f'{fpath} is truncated.')
+		yield kind, position, length
+		position += length
+
+class MappedChunkedArrays:
+	"""Gives access to the arrays in a file written by a `ChunkedWriter`
+	without reading it: the file is memory mapped and each array is a 
+	read only NumPy array that points into the map, so only the parts
+	that are used are ever read from the disk. For example
+	```
+	waveforms = MappedChunkedArrays(path_to_file)
+	print(len(waveforms)) # Does not read the arrays.
+	print(waveforms[9999][:10]) # Reads only the first 10 samples of the 10000th waveform.
+	```
+	The arrays must not be used after `close`. The checksums of the chunks
+	are not verified, as that would require reading everything, use
+	`validate_chunked` for that.
+	"""
+	def __init__(self, fpath:Path, ignore_missing_footer:bool=False):
+		"""Create an instance of `MappedChunkedArrays`.
+		
+		Parameters
+		----------
+		fpath: Path
+			Path to the file.
+		ignore_missing_footer: bool, default `False`
+			If `True`, files that were not closed (e.g. because the script
+			crashed) are mapped up to the last complete chunk. Otherwise a
+			`ValueError` is raised.
+		"""
+		if not isinstance(fpath, Path):
+			raise TypeError(f'`fpath` must be an instance of {Path}, received object of type {type(fpath)}.')
+		self._fpath = fpath
+		with open(fpath, 'rb') as ifile:
+			self._mmap = mmap.mmap(ifile.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(ifile.fileno()).st_size > 0 else b'' # An empty file cannot be mapped.
+		self._chunks = [] # `(offset, length)` of the payload of each array.
+		self._arrays_headers = dict() # Cache of `(dtype, shape, order, offset_of_data)`.
+		footer_found = False
+		try:
+			for kind, offset, length in _iter_chunk_headers(self._mmap, fpath):
+				if kind == ARRAY_CHUNK:
+					self._chunks.append((offset, length))
+				elif kind == FOOTER_CHUNK:
+					footer_found = True
+		except ValueError:
+			if not ignore_missing_footer:
+				self.close()
+				raise
+		if not footer_found and not ignore_missing_footer:
+			self.close()
+			raise ValueError(f'{fpath} has no footer, it was not closed properly (maybe the script crashed). Use `ignore_missing_footer=True` to read it anyway.')
+	
+	@property
+	def path(self) -> Path:
+		"""Path to the file."""
+		return self._fpath
+	
+	def __len__(self):
+		return len(self._chunks)
+	
+	def __getitem__(self, idx):
+		if isinstance(idx, slice):
+			return [self[i] for i in range(*idx.indices(len(self)))]
+		n_array = range(len(self))[idx] # Handles negative indices and raises `IndexError`.
+		import numpy # Only needed if there are arrays.
+		if n_array not in self._arrays_headers:
+			offset, length = self._chunks[n_array]
+			header = io.BytesIO(self._mmap[offset:offset+min(length, 2**16+16)]) # The header of a `.npy` is never longer than this.
+			version = numpy.lib.format.read_magic(header)
+			if version == (1,0):
+				shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(header)
+			else:
+				shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(header)
+			if dtype.hasobject:
+				raise ValueError(f'Array {n_array} in {self.path} contains Python objects, it cannot be memory mapped.')
+			self._arrays_headers[n_array] = (dtype, shape, 'F' if fortran_order else 'C', offset + header.tell())
+		dtype, shape, order, offset = self._arrays_headers[n_array]
+		count = 1
+		for n in shape:
+			count *= n
+		return numpy.frombuffer(self._mmap, dtype=dtype, count=count, offset=offset).reshape(shape, order=order)
+	
+	def __iter__(self):
+		for n_array in range(len(self)):
+			yield self[n_array]
+	
+	def close(self):
+		"""Closes the memory map. Arrays obtained before must not be used
+		anymore."""
+		if isinstance(self._mmap, mmap.mmap):
+			try:
+				self._mmap.close()
+			except BufferError: # Some arrays are still alive, it will be closed when they are deleted.
+				pass
+		self._mmap = b''
+		self._chunks = []
+	
+	def __enter__(self):
+		return self
+	
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		self.close()
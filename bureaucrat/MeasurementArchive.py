@@ -0,0 +1,193 @@
+from pathlib import Path
+import zipfile
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from bureaucrat.SmarterBureaucrat import iter_submeasurements, _read_run_status_from_output_directory, SCRIPTS_BACKUPS_DIRECTORY_NAME, TRASH_DIRECTORY_NAME, GATHER_CACHE_DIRECTORY_NAME, PUBLISHING_DIRECTORY_NAME, LOCK_FILE_NAME_PREFIX
+
+ARCHIVE_INDEX_FILE_NAME = 'SmarterBureaucrat_archive_index.json'
+ARCHIVE_FORMAT_VERSION = 1
+NOT_PACKED_DIRECTORIES = {TRASH_DIRECTORY_NAME, GATHER_CACHE_DIRECTORY_NAME, PUBLISHING_DIRECTORY_NAME}
+
+def pack_measurement(measurement_base_path:Path, path_to_archive:Path=None, compression:int=zipfile.ZIP_STORED, max_workers:int=None) -> Path:
+	"""Packs a finished measurement, with all its submeasurements, into
+	a single zip file. A tree with thousands of submeasurements becomes
+	a single file, which is much faster to copy, to backup and to scan.
+	The archive can be read directly with a bureaucrat, see `MeasurementArchive`,
+	or extracted with `unpack_measurement` (or any zip tool).
+	
+	Parameters
+	----------
+	measurement_base_path: Path
+		Path to the measurement.
+	path_to_archive: Path, optional
+		Path to the archive to create, by default the path to the
+		measurement with `.zip` appended.
+	compression: int, default `zipfile.ZIP_STORED`
+		Compression method, see `zipfile`. By default nothing is
+		compressed, so reading from the archive is as fast as possible.
+	max_workers: int, optional
+		Number of threads for reading the run statuses of the tasks, by
+		default what `concurrent.futures.ThreadPoolExecutor` decides.
+	
+	Returns
+	-------
+	path_to_archive: Path
+		Path to the archive.
+	"""
+	if not isinstance(measurement_base_path, Path):
+		raise TypeError(f'`measurement_base_path` must be an instance of {Path}, received object of type {type(measurement_base_path)}.')
+	if not measurement_base_path.is_dir():
+		raise FileNotFoundError(f'Directory {measurement_base_path} does not exist.')
+	if path_to_archive is None:
+		path_to_archive = measurement_base_path.parent/Path(f'{measurement_base_path.name}.zip')
+	root_name = measurement_base_path.resolve().name
+	
+	# Build the index, the same information as in `MeasurementsTreeIndex` ---
+	measurements = {'.': {'parent': None, 'created_by_task': None}}
+	for parent, submeasurement in iter_submeasurements(measurement_base_path, max_workers=max_workers):
+		measurements[submeasurement.relative_to(measurement_base_path).as_posix()] = {
+			'parent': parent.relative_to(measurement_base_path).as_posix(),
+			'created_by_task': submeasurement.parent.parent.name,
+		}
+	def read_tasks(relative_path:str):
+		tasks = dict()
+		with os.scandir(measurement_base_path/Path(relative_path)) as entries:
+			for entry in entries:
+				if entry.is_dir() and entry.name not in NOT_PACKED_DIRECTORIES and entry.name != SCRIPTS_BACKUPS_DIRECTORY_NAME:
+					tasks[entry.name] = _read_run_status_from_output_directory(Path(entry.path))
+				elif entry.name.startswith(LOCK_FILE_NAME_PREFIX):
+					raise RuntimeError(f'The task {repr(entry.name[len(LOCK_FILE_NAME_PREFIX):])} is running on {measurement_base_path/Path(relative_path)}, only finished measurements can be packed.')
+		return tasks
+	with ThreadPoolExecutor(max_workers=max_workers) as executor:
+		tasks = dict(zip(measurements, executor.map(read_tasks, measurements)))
+	
+	# Write the archive ---
+	path_to_temporary_archive = path_to_archive.parent/Path(f'.{path_to_archive.name}.{os.getpid()}.tmp')
+	try:
+		with zipfile.ZipFile(path_to_temporary_archive, 'x', compression=compression, allowZip64=True) as archive:
+			archive.writestr(ARCHIVE_INDEX_FILE_NAME, json.dumps({'format_version': ARCHIVE_FORMAT_VERSION, 'root': root_name, 'measurements': measurements, 'tasks': tasks}))
+			for dirpath, dirnames, filenames in os.walk(measurement_base_path):
+				if Path(dirpath) == measurement_base_path or Path(dirpath).name == 'submeasurements' or Path(dirpath).parent.name == 'submeasurements': # In the directory of a measurement.
+					dirnames[:] = [d for d in dirnames if d not in NOT_PACKED_DIRECTORIES]
+				relative_path = Path(dirpath).relative_to(measurement_base_path)
+				archive.write(dirpath, (Path(root_name)/relative_path).as_posix()) # So empty directories are kept.
+				for filename in filenames:
+					archive.write(os.path.join(dirpath, filename), (Path(root_name)/relative_path/Path(filename)).as_posix())
+		os.replace(path_to_temporary_archive, path_to_archive)
+	except BaseException:
+		path_to_temporary_archive.unlink(missing_ok=True)
+		raise
+	return path_to_archive
+
+def unpack_measurement(path_to_archive:Path, path_to_directory:Path) -> Path:
+	"""Extracts an archive created by `pack_measurement` into the directory
+	`path_to_directory`, and returns the path to the measurement."""
+	if not isinstance(path_to_archive, Path):
+		raise TypeError(f'`path_to_archive` must be an instance of {Path}, received object of type {type(path_to_archive)}.')
+	if not isinstance(path_to_directory, Path):
+		raise TypeError(f'`path_to_directory` must be an instance of {Path}, received object of type {type(path_to_directory)}.')
+	archive = MeasurementArchive.open(path_to_archive)
+	if (path_to_directory/Path(archive.root_name)).exists():
+		raise FileExistsError(f'{path_to_directory/Path(archive.root_name)} already exists.')
+	with zipfile.ZipFile(path_to_archive, 'r') as z:
+		z.extractall(path_to_directory, members=[name for name in z.namelist() if name != ARCHIVE_INDEX_FILE_NAME])
+	return path_to_directory/Path(archive.root_name)
+
+class MeasurementArchive:
+	"""Read only access to an archive created by `pack_measurement`. The
+	paths within the archive are `zipfile.Path` objects, which can be
+	used very much like `pathlib.Path` objects for reading, e.g.
+	```
+	archive = MeasurementArchive.open(Path('measurement.zip'))
+	with (archive.path_to_root_measurement/'measure'/'measured_data.txt').open() as ifile:
+		...
+	```
+	The submeasurements and the run status of the tasks are answered
+	from the index stored in the archive, without scanning it. Usually
+	you do not use this directly but through a bureaucrat:
+	```
+	Paul = NamedTaskBureaucrat(Path('measurement.zip'), task_name='whatever', _locals=locals())
+	Paul.find_all_submeasurements() # Works as usual.
+	```
+	"""
+	_open_archives = dict()
+	_open_archives_lock = threading.Lock()
+	
+	def __init__(self, path_to_archive:Path):
+		"""Create an instance of `MeasurementArchive`, better use `MeasurementArchive.open`
+		which reuses the instances."""
+		if not isinstance(path_to_archive, Path):
+			raise TypeError(f'`path_to_archive` must be an instance of {Path}, received object of type {type(path_to_archive)}.')
+		self._path_to_archive = path_to_archive
+		self._zipfile = zipfile.ZipFile(path_to_archive, 'r')
+		try:
+			index = json.loads(self._zipfile.read(ARCHIVE_INDEX_FILE_NAME))
+		except KeyError:
+			raise ValueError(f'{path_to_archive} was not created by `pack_measurement`.')
+		if index['format_version'] > ARCHIVE_FORMAT_VERSION:
+			raise ValueError(f'{path_to_archive} was created by a newer version of the bureaucrat, please update.')
+		self._root_name = index['root']
+		self._measurements = index['measurements']
+		self._tasks = index['tasks']
+		self._children = dict()
+		for path, measurement in self._measurements.items():
+			if measurement['parent'] is not None:
+				self._children.setdefault(measurement['parent'], []).append(path)
+		self._path_to_root_measurement = zipfile.Path(self._zipfile, at=f'{self._root_name}/')
+	
+	@classmethod
+	def open(cls, path_to_archive:Path):
+		"""Returns the `MeasurementArchive` of `path_to_archive`, which is
+		opened only the first time (unless the file changed)."""
+		stat = os.stat(path_to_archive)
+		key = (os.path.abspath(path_to_archive), stat.st_mtime_ns, stat.st_size)
+		with cls._open_archives_lock:
+			if key not in cls._open_archives:
+				cls._open_archives[key] = cls(path_to_archive)
+			return cls._open_archives[key]
+	
+	@classmethod
+	def of_path(cls, path:zipfile.Path):
+		"""Returns the `MeasurementArchive` to which `path` belongs."""
+		return cls.open(Path(path.root.filename))
+	
+	@staticmethod
+	def is_archive(path) -> bool:
+		"""`True` if `path` is an archive file or a path within one."""
+		return isinstance(path, zipfile.Path) or (isinstance(path, Path) and path.is_file() and zipfile.is_zipfile(path))
+	
+	@property
+	def path_to_archive(self) -> Path:
+		return self._path_to_archive
+	
+	@property
+	def root_name(self) -> str:
+		"""Name of the measurement in the archive."""
+		return self._root_name
+	
+	@property
+	def path_to_root_measurement(self) -> zipfile.Path:
+		return self._path_to_root_measurement
+	
+	def _relative_path(self, path:zipfile.Path) -> str:
+		at = path.at.rstrip('/')
+		if at == self._root_name:
+			return '.'
+		if not at.startswith(f'{self._root_name}/'):
+			raise ValueError(f'{path} is not within the measurement in the archive.')
+		return at[len(self._root_name)+1:]
+	
+	def submeasurements_of(self, measurement_base_path:zipfile.Path) -> dict:
+		"""Same as `MeasurementsTreeIndex.submeasurements_of`."""
+		submeasurements = dict()
+		for path in self._children.get(self._relative_path(measurement_base_path), []):
+			submeasurements.setdefault(self._measurements[path]['created_by_task'], dict())[path.split('/')[-1]] = self.path_to_root_measurement/path
+		return submeasurements
+	
+	def task_was_applied_without_errors(self, measurement_base_path:zipfile.Path, task_name:str) -> bool:
+		"""Returns `True` if the task whose output directory is named
+		`task_name` ended without errors on the measurement, `False`
+		otherwise."""
+		return self._tasks.get(self._relative_path(measurement_base_path), dict()).get(task_name, False)
@@ -3,28 +3,1036 @@ import datetime
 import warnings
 import inspect
 import tempfile
-from shutil import rmtree
+from shutil import rmtree, copy2
+import sqlite3
+import os
+import json
+import hashlib
+import errno
+import reprlib
+import itertools
+import collections
+import threading
+import socket
+import time
+import uuid
+import pickle
+import csv
+import zipfile
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from bureaucrat.ChunkedWriter import ChunkedWriter, MappedChunkedArrays, MAGIC as CHUNKED_FILE_MAGIC
+from bureaucrat.BlockCompressedWriter import COMPRESSIONS, open_compressed_for_writing, open_compressed_for_reading
+import mmap
+try:
+	import resource # Not available in Windows.
+except ImportError:
+	resource = None
 
 NICE_CHARACTERS_FOR_FILE_AND_DIRECTORY_NAMES = {'A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O', 'P', 'Q', 'R', 'S', 'T', 'U', 'V', 'W', 'X', 'Y', 'Z', 'a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm', 'n', 'o', 'p', 'q', 'r', 's', 't', 'u', 'v', 'w', 'x', 'y', 'z', '0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '.', '_', '-'} # https://stackoverflow.com/a/1976172/8849755
 
-def find_submeasurements_recursively(measurement_base_path:Path) -> dict:
-	submeasurements = dict()
-	for p in measurement_base_path.iterdir():
-		if p.is_dir():
-			if (p/Path('submeasurements')).is_dir():
-				for pp in (p/Path('submeasurements')).iterdir():
-					if pp.is_dir():
-						submeasurements[str(pp)] = find_submeasurements_recursively(pp)
-	if len(submeasurements)>0:
-		return {str(measurement_base_path):submeasurements}
+INDEX_FILE_NAME = 'SmarterBureaucrat_index.sqlite'
+ERRORS_REPORT_FILE_NAME = 'SmarterBureaucrat_errors_report.txt'
+RUN_RECORD_FILE_NAME = 'SmarterBureaucrat_run.json'
+RUN_RECORD_FORMAT_VERSION = 1
+SCRIPTS_BACKUPS_DIRECTORY_NAME = 'SmarterBureaucrat_scripts_backups'
+TRASH_DIRECTORY_NAME = 'SmarterBureaucrat_trash'
+LOCK_FILE_NAME_PREFIX = 'SmarterBureaucrat_lock.'
+PROGRESS_JOURNAL_FILE_NAME = 'SmarterBureaucrat_progress_journal.txt'
+GATHER_CACHE_DIRECTORY_NAME = 'SmarterBureaucrat_gather_cache'
+PUBLISHING_DIRECTORY_NAME = 'SmarterBureaucrat_publishing'
+LOCALS_FILE_NAME = 'SmarterBureaucrat_locals.json'
+RSS_SAMPLING_PERIOD = 0.1 # Seconds between samples of the RAM used by the process while bureaucrats are doing their magic, see `_ResourcesMonitor`.
+
+_last_timestamp_used_for_naming = None
+_naming_lock = threading.Lock()
+
+def _timestamped_path(measurement_base_path:Path, timestamp:datetime.datetime) -> Path:
+	"""Returns the path for a new measurement, i.e. `measurement_base_path`
+	with the timestamp prepended to its name. The timestamp has a resolution
+	of microseconds and within one Python process it is never repeated,
+	so names sort chronologically. Different processes may still produce
+	the same name, this is handled by the bureaucrat when it creates the
+	directory."""
+	global _last_timestamp_used_for_naming
+	with _naming_lock:
+		if _last_timestamp_used_for_naming is not None and timestamp <= _last_timestamp_used_for_naming:
+			timestamp = _last_timestamp_used_for_naming + datetime.timedelta(microseconds=1)
+		_last_timestamp_used_for_naming = timestamp
+	return measurement_base_path.parent/Path(f'{timestamp.strftime("%Y%m%d%H%M%S%f")}_{measurement_base_path.parts[-1]}')
+
+def _empty_trash_directory(path_to_trash_directory:Path):
+	"""Deletes everything inside `path_to_trash_directory`, but not the
+	directory itself because other bureaucrats may be moving stuff into
+	it at the same time."""
+	for p in path_to_trash_directory.iterdir():
+		rmtree(p, ignore_errors=True)
+
+def _copy_directory_in_parallel(source:Path, destination:Path, max_workers:int=None):
+	"""Copies the directory `source` into `destination`, which must not
+	exist, copying many files at the same time. This is much faster than
+	`shutil.copytree` for many small files in network file systems."""
+	files = []
+	for dirpath, dirnames, filenames in os.walk(source):
+		(destination/Path(os.path.relpath(dirpath, source))).mkdir(parents=True)
+		files += [(Path(dirpath)/Path(filename), destination/Path(os.path.relpath(dirpath, source))/Path(filename)) for filename in filenames]
+	with ThreadPoolExecutor(max_workers=max_workers) as executor:
+		for future in [executor.submit(copy2, src, dst, follow_symlinks=False) for src, dst in files]:
+			future.result() # Raise any error.
+
+_LOCALS_SERIALIZERS = dict()
+
+def register_locals_serializer(cls:type, serializer):
+	"""Tells the bureaucrats how to write the local variables of type
+	`cls` (and its subclasses) in the backup of the script. `serializer`
+	must be a function that receives the value and returns a string. 
+	This is useful for big objects whose `repr` is long or slow, e.g.
+	```
+	register_locals_serializer(MyOscilloscope, lambda osc: f'<MyOscilloscope at {osc.address}>')
+	```
+	"""
+	if not isinstance(cls, type):
+		raise TypeError(f'`cls` must be a type, received object of type {type(cls)}.')
+	if not callable(serializer):
+		raise TypeError(f'`serializer` must be callable, received object of type {type(serializer)}.')
+	_LOCALS_SERIALIZERS[cls] = serializer
+
+def _checksum_of_buffer(value) -> str:
+	try:
+		return hashlib.sha256(memoryview(value)).hexdigest()
+	except (TypeError, ValueError, BufferError): # E.g. a non contiguous array.
+		return hashlib.sha256(value.tobytes()).hexdigest()
+
+def _checksum_of_dataframe(value) -> str:
+	# Also for the other pandas objects, e.g. `Series`, which have `dtype` but no buffer.
+	import pandas # If we are here, it is because there is a pandas object.
+	return hashlib.sha256(pandas.util.hash_pandas_object(value, index=True).values.tobytes()).hexdigest()
+
+def summarize_local(value, max_length:int) -> str:
+	"""Returns a string representing `value` of at most `max_length` 
+	characters (plus `'... <truncated>'` if it was truncated). Arrays (anything
+	with `shape` and `dtype`, e.g. NumPy arrays) and dataframes (anything
+	with `shape` and `dtypes`, e.g. pandas) are summarized by their shape,
+	type and checksum, types registered with `register_locals_serializer`
+	use their serializer and everything else uses `repr`, bounded for
+	big containers.
+	"""
+	for cls in type(value).__mro__:
+		if cls in _LOCALS_SERIALIZERS:
+			summary = _LOCALS_SERIALIZERS[cls](value)
+			break
 	else:
+		if hasattr(value, 'shape') and (hasattr(value, 'dtype') or hasattr(value, 'dtypes')) and not (inspect.ismodule(value) or isinstance(value, type)): # E.g. `numpy` itself has `shape` and `dtype`.
+			is_dataframe = not hasattr(value, 'dtype')
+			is_pandas = type(value).__module__.split('.')[0] == 'pandas'
+			try:
+				checksum = (_checksum_of_dataframe if is_dataframe or is_pandas else _checksum_of_buffer)(value)
+			except Exception: # Whatever happens, this is not worth crashing the script.
+				checksum = 'unknown'
+			summary = f'<{type(value).__module__}.{type(value).__name__} shape={tuple(value.shape)} {"dtypes="+repr(dict(value.dtypes.astype(str))) if is_dataframe else "dtype="+str(value.dtype)} sha256={checksum}>'
+		elif isinstance(value, _BoundedRepr.CONTAINERS): # Bounded also inside, e.g. a short list of huge strings.
+			summary = _BoundedRepr(max_length).repr(value)
+		elif isinstance(value, (str, bytes)) and len(value) > max_length:
+			summary = repr(value[:max_length+1])
+		else:
+			summary = repr(value)
+	if len(summary) > max_length:
+		summary = f'{summary[:max_length]}... <truncated>'
+	return summary
+
+class _BoundedRepr(reprlib.Repr):
+	"""Like `repr` but it stops looking at the value as soon as it has 
+	more than `max_length` characters, at any level of nested containers,
+	so a huge value is not turned into a huge string just to truncate 
+	it afterwards. Not thread safe, create one for each use."""
+	CONTAINERS = (list, tuple, set, frozenset, dict, collections.deque)
+	
+	def __init__(self, max_length:int):
+		super().__init__()
+		self.maxlist = self.maxtuple = self.maxset = self.maxfrozenset = self.maxdict = self.maxdeque = self.maxarray = max(1, max_length//2) # Each element needs at least two characters, e.g. `1,`.
+		self.maxstring = self.maxlong = self.maxother = max_length
+		self.maxlevel = 10
+		self._max_length = max_length
+	
+	def repr(self, x):
+		self._remaining_length = self._max_length
+		return super().repr(x)
+	
+	def repr1(self, x, level):
+		if self._remaining_length <= 0:
+			return self.fillvalue
+		r = super().repr1(x, level)
+		self._remaining_length -= 2 if isinstance(x, self.CONTAINERS) else len(r) # The contents of containers were already counted.
+		return r
+	
+	def repr_dict(self, x, level):
+		# Same as in `reprlib` but keeping the order of the keys, like `repr`.
+		if len(x) == 0:
+			return '{}'
+		if level <= 0:
+			return '{' + self.fillvalue + '}'
+		pieces = [f'{self.repr1(key, level-1)}: {self.repr1(x[key], level-1)}' for key in itertools.islice(x, self.maxdict)]
+		if len(x) > self.maxdict:
+			pieces.append(self.fillvalue)
+		return '{' + ', '.join(pieces) + '}'
+
+def _jsonable_locals(_locals:dict, max_length:int) -> dict:
+	"""Returns a dictionary with the items of `_locals` that can be 
+	stored in JSON as they are (numbers, strings, lists, etc.) and 
+	whose JSON is shorter than `max_length`."""
+	jsonable = dict()
+	for key, value in _locals.items():
+		if isinstance(value, (list, tuple, dict, str)) and len(value) > max_length:
+			continue
+		if not isinstance(value, (bool, int, float, str, list, tuple, dict, type(None))):
+			continue
+		length = 0
+		try:
+			for chunk in json.JSONEncoder().iterencode(value): # Not `json.dumps`, so we stop as soon as it is too long instead of encoding everything.
+				length += len(chunk)
+				if length > max_length:
+					break
+		except (TypeError, ValueError): # E.g. a list containing non JSON stuff.
+			continue
+		if length <= max_length:
+			jsonable[key] = value
+	return jsonable
+
+def _sha256_of_each_jsonable_local(jsonable_locals:dict) -> dict:
+	return {key: hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest() for key, value in sorted(jsonable_locals.items())}
+
+def _scalar_locals(jsonable_locals:dict) -> dict:
+	"""Returns the items of `jsonable_locals` that are numbers or strings,
+	which are the ones that can be searched for with the index."""
+	return {key: value for key, value in jsonable_locals.items() if isinstance(value, (bool, int, float, str))}
+
+def find_submeasurements_recursively(measurement_base_path:Path, max_workers:int=None) -> dict:
+	index = MeasurementsTreeIndex.of_measurement(measurement_base_path)
+	if index is not None:
+		return index.submeasurements_tree(measurement_base_path)
+	return _scan_submeasurements_recursively(measurement_base_path, max_workers=max_workers)
+
+def _scan_submeasurements_recursively(measurement_base_path:Path, max_workers:int=None) -> dict:
+	children = dict()
+	for parent, submeasurement in iter_submeasurements(measurement_base_path, max_workers=max_workers):
+		children.setdefault(parent, []).append(submeasurement)
+	def build_tree(path:Path):
+		if path not in children:
+			return None
+		return {str(path): {str(p): build_tree(p) for p in children[path]}}
+	return build_tree(measurement_base_path)
+
+def _scandir_submeasurements(measurement_base_path:Path) -> list:
+	"""Returns a list with the paths of the first level submeasurements
+	of `measurement_base_path`, using `os.scandir` so no extra `stat`
+	calls are needed in most file systems."""
+	submeasurements = []
+	with os.scandir(measurement_base_path) as entries:
+		for entry in entries:
+			if not entry.is_dir():
+				continue
+			try:
+				with os.scandir(Path(entry.path)/Path('submeasurements')) as subentries: # Trying is cheaper than first checking whether it exists.
+					for subentry in subentries:
+						if subentry.is_dir():
+							submeasurements.append(measurement_base_path/Path(entry.name)/Path('submeasurements')/Path(subentry.name))
+			except (FileNotFoundError, NotADirectoryError):
+				pass
+	return submeasurements
+
+def iter_submeasurements(measurement_base_path:Path, max_workers:int=None, max_depth:int=None):
+	"""Walks the tree of submeasurements of `measurement_base_path` and
+	yields tuples `(path_to_parent_measurement, path_to_submeasurement)`
+	as they are found, so you can start using them before the walk ends.
+	Independent subtrees are walked in parallel by a pool of threads, so
+	the order is not defined.
+	
+	Parameters
+	----------
+	measurement_base_path: Path
+		Path to the measurement to start from.
+	max_workers: int, optional
+		Number of threads, by default what `concurrent.futures.ThreadPoolExecutor`
+		decides.
+	max_depth: int, optional
+		If given, submeasurements deeper than this are not looked for. 
+		For example `max_depth=1` only yields the first level 
+		submeasurements.
+	"""
+	if max_depth is not None and max_depth < 1:
+		return
+	executor = ThreadPoolExecutor(max_workers=max_workers)
+	try:
+		pending = {executor.submit(_scandir_submeasurements, measurement_base_path): (measurement_base_path, 1)}
+		while len(pending) > 0:
+			done, _ = wait(pending, return_when=FIRST_COMPLETED)
+			for future in done:
+				parent, depth = pending.pop(future)
+				for submeasurement in future.result():
+					if max_depth is None or depth < max_depth:
+						pending[executor.submit(_scandir_submeasurements, submeasurement)] = (submeasurement, depth+1)
+					yield parent, submeasurement
+	finally:
+		executor.shutdown(wait=False, cancel_futures=True)
+
+def find_root_measurement(measurement_base_path:Path) -> Path:
+	"""Given the path to a measurement, which may be a submeasurement
+	of a submeasurement of..., returns the path to the top level 
+	measurement. This only looks at the path, the file system is not
+	accessed.
+	"""
+	root = measurement_base_path
+	while root.parent.name == 'submeasurements':
+		root = root.parent.parent.parent
+	return root
+
+def _write_text_atomically(text:str, fpath:Path):
+	"""Writes `text` into `fpath` in such a way that whoever reads
+	`fpath` will never find a half written file."""
+	path_to_temporary_file = fpath.parent/Path(f'.{fpath.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+	with path_to_temporary_file.open('w') as ofile:
+		ofile.write(text)
+	os.replace(path_to_temporary_file, fpath)
+
+def _write_json_atomically(data:dict, fpath:Path):
+	"""Same as `_write_text_atomically` for JSON."""
+	_write_text_atomically(json.dumps(data, indent='\t'), fpath)
+
+class TaskAlreadyRunningError(RuntimeError):
+	"""Raised when a bureaucrat is asked to do its magic on a task that
+	another bureaucrat, maybe in another process or computer, is doing
+	right now on the same measurement."""
+	pass
+
+def _read_lock(path_to_lock_file:Path) -> dict:
+	try:
+		with open(path_to_lock_file, 'r') as ifile:
+			return json.load(ifile)
+	except (FileNotFoundError, json.JSONDecodeError): # It may be being written right now.
+		return None
+
+def _lock_is_stale(path_to_lock_file:Path, stale_after:float) -> bool:
+	"""Decides whether the lock in `path_to_lock_file` was left by a
+	bureaucrat that is not running anymore. This is the case if it was
+	created in this computer by a process that does not exist anymore, or
+	if its heartbeat (the modification time of the file) stopped more 
+	than `stale_after` seconds ago."""
+	lock = _read_lock(path_to_lock_file)
+	try:
+		seconds_since_last_heartbeat = time.time() - os.stat(path_to_lock_file).st_mtime
+	except FileNotFoundError:
+		return False # It was just released.
+	if lock is not None and lock['host'] == socket.gethostname() and os.name == 'posix':
+		try:
+			os.kill(lock['pid'], 0) # Does not kill, only checks if it exists.
+		except ProcessLookupError:
+			return True
+		except PermissionError: # It exists, but belongs to someone else.
+			pass
+	return seconds_since_last_heartbeat > stale_after
+
+def read_run_record(path_to_output_directory:Path) -> dict:
+	"""Returns the run record left by a bureaucrat in `path_to_output_directory`
+	as a dictionary, or `None` if there is no run record. Bureaucrats
+	older than the run record do not leave it."""
+	try:
+		with (path_to_output_directory/Path(RUN_RECORD_FILE_NAME)).open('r') as ifile: # Not `open(...)`, so it also works with paths within archives, see `MeasurementArchive`.
+			return json.load(ifile)
+	except FileNotFoundError:
 		return None
 
+def manifest_of_output_directory(path_to_output_directory:Path) -> str:
+	"""Returns a string that changes whenever the output of the task
+	in `path_to_output_directory` changes, or `None` if the directory
+	does not exist. If the task has a run record this is the SHA-256 of
+	the run record, so it changes each time the task is run again. For 
+	older bureaucrats it is the SHA-256 of the size and modification time
+	of the errors report (or the flag file of even older ones) and of
+	the directory, which also change each time the task is run again. 
+	The other files are not looked at, they may be thousands."""
+	try:
+		return hashlib.sha256((path_to_output_directory/Path(RUN_RECORD_FILE_NAME)).read_bytes()).hexdigest()
+	except FileNotFoundError:
+		pass
+	sha256 = hashlib.sha256()
+	for name in ['.', ERRORS_REPORT_FILE_NAME, 'script_successfully_applied', '.script_successfully_applied']:
+		try:
+			stat = os.stat(path_to_output_directory/Path(name))
+		except (FileNotFoundError, NotADirectoryError):
+			if name == '.':
+				return None
+			continue
+		sha256.update(f'{name}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode())
+	return sha256.hexdigest()
+
+def _size_of_output_directory(path_to_output_directory:Path) -> tuple:
+	"""Returns `(number_of_bytes, number_of_files)` of all the files in
+	`path_to_output_directory`, not counting the submeasurements, which
+	have their own output directories."""
+	n_bytes = 0
+	n_files = 0
+	directories = [path_to_output_directory]
+	while len(directories) > 0:
+		with os.scandir(directories.pop()) as entries:
+			for entry in entries:
+				if entry.is_dir(follow_symlinks=False):
+					if not (entry.name == 'submeasurements' and Path(entry.path).parent == path_to_output_directory):
+						directories.append(Path(entry.path))
+				elif entry.is_file(follow_symlinks=False):
+					n_bytes += entry.stat(follow_symlinks=False).st_size
+					n_files += 1
+	return n_bytes, n_files
+
+def _peak_rss() -> int:
+	"""Returns the maximum resident set size (i.e. RAM used) by the 
+	current process so far, in bytes, or `None` if it is not available."""
+	if resource is None:
+		return None
+	peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return peak_rss if os.uname().sysname == 'Darwin' else peak_rss*1024 # Linux gives it in kilobytes, macOS in bytes.
+
+def _current_rss() -> int:
+	"""Returns the resident set size (i.e. RAM used) by the current 
+	process now, in bytes, or `None` if it is not available (it is read
+	from `/proc`, so only in Linux)."""
+	try:
+		with open('/proc/self/statm', 'rb') as ifile:
+			return int(ifile.read().split()[1])*mmap.PAGESIZE
+	except (OSError, ValueError, IndexError):
+		return None
+
+class _ResourcesMonitor:
+	"""Keeps track of the bureaucrats doing their magic in this process.
+	While any of them is running, a single thread samples the RAM used
+	by the process every `RSS_SAMPLING_PERIOD` seconds, so each of them
+	knows the peak during its own magic. RAM and CPU time belong to the
+	whole process, so each of them also learns whether others were 
+	running in other threads at the same time, in which case they are 
+	not only its own. Magics nested in the same thread, e.g. those of 
+	`create_submeasurement`, do not count, since the outer one waits."""
+	def __init__(self):
+		self._lock = threading.Lock()
+		self._anything_running = threading.Condition(self._lock)
+		self._running = dict()
+		self._sampling_thread = None
+	
+	def start(self) -> dict:
+		"""Starts monitoring a magic, returns a dictionary with `rss_at_start`,
+		`peak_rss` and `shared_process` that is updated until `stop`."""
+		rss = _current_rss()
+		usage = {'rss_at_start': rss, 'peak_rss': rss, 'shared_process': False}
+		thread = threading.get_ident()
+		with self._lock:
+			for other_thread, other in self._running.values():
+				if other_thread != thread:
+					usage['shared_process'] = True
+					other['shared_process'] = True
+			self._running[id(usage)] = (thread, usage)
+			if rss is not None and self._sampling_thread is None:
+				self._sampling_thread = threading.Thread(target=self._sample, daemon=True)
+				self._sampling_thread.start()
+			self._anything_running.notify()
+		return usage
+	
+	def stop(self, usage:dict) -> dict:
+		"""Stops monitoring the magic of `usage`, it can be called many
+		times. Returns `usage`."""
+		rss = _current_rss()
+		with self._lock:
+			if self._running.pop(id(usage), None) is not None and rss is not None:
+				usage['peak_rss'] = max(usage['peak_rss'], rss)
+		return usage
+	
+	def _sample(self):
+		while True:
+			with self._lock:
+				while len(self._running) == 0:
+					self._anything_running.wait()
+			rss = _current_rss()
+			with self._lock:
+				for thread, usage in self._running.values():
+					usage['peak_rss'] = max(usage['peak_rss'], rss)
+			time.sleep(RSS_SAMPLING_PERIOD)
+
+_resources_monitor = _ResourcesMonitor()
+if hasattr(os, 'register_at_fork'): # The sampling thread does not exist in a forked process, e.g. in `run_on_submeasurements`.
+	os.register_at_fork(after_in_child=lambda: _resources_monitor.__init__())
+
+def resources_report(measurement_base_path:Path, sort_by:str='wall_time', group_by:str=None) -> list:
+	"""Collects the resources used by each task in a measurement tree, as
+	stored in the run records by the bureaucrats, and ranks them, so you
+	know what is worth optimizing. For example
+	```
+	for row in resources_report(path_to_measurement, group_by='task')[:5]:
+		print(row)
+	```
+	prints the 5 tasks that took more time in total.
+	
+	Parameters
+	----------
+	measurement_base_path: Path
+		Path to the measurement from which to start, usually the top
+		level measurement.
+	sort_by: str, default `'wall_time'`
+		One of `'wall_time'`, `'cpu_time'`, `'cpu_time_thread'`, 
+		`'cpu_time_children'`, `'peak_rss'`, `'bytes_written'` or `'files'`.
+		The result is sorted by this, from highest to lowest.
+	group_by: str, optional
+		If `None`, there is one row per run of a task on a measurement.
+		If `'task'`, the runs of each task in all the measurements are
+		added up. If `'measurement'`, the runs of all the tasks on each
+		measurement are added up. The `peak_rss` of a group is the 
+		maximum, not the sum, and `shared_process` is `True` if it is
+		`True` for any of the runs.
+	
+	Returns
+	-------
+	report: list of dict
+		Each row is a dictionary with the resources, `'measurement'` (a
+		Path) and `'task'` (a str) unless grouped away, and `'runs'` with
+		the number of runs added up. `cpu_time` and `peak_rss` are those
+		of the whole process, so when `shared_process` is `True` they
+		include other tasks that were running in the same process at 
+		the same time, see `cpu_time_thread` for those tasks.
+	"""
+	RESOURCES = ['wall_time', 'cpu_time', 'cpu_time_thread', 'cpu_time_children', 'peak_rss', 'bytes_written', 'files']
+	if not isinstance(measurement_base_path, Path):
+		raise TypeError(f'`measurement_base_path` must be an instance of {Path}, received object of type {type(measurement_base_path)}.')
+	if sort_by not in RESOURCES:
+		raise ValueError(f'`sort_by` must be one of {RESOURCES}, received {repr(sort_by)}.')
+	if group_by not in {None, 'task', 'measurement'}:
+		raise ValueError(f"`group_by` must be `None`, `'task'` or `'measurement'`, received {repr(group_by)}.")
+	measurements = [measurement_base_path] + [submeasurement for parent, submeasurement in iter_submeasurements(measurement_base_path)]
+	def read_resources_of_measurement(measurement):
+		rows = []
+		with os.scandir(measurement) as entries:
+			for entry in entries:
+				if not entry.is_dir():
+					continue
+				run_record = read_run_record(Path(entry.path))
+				if run_record is None or run_record.get('resources') is None: # Older bureaucrats, or still running.
+					continue
+				rows.append({'measurement': measurement, 'task': entry.name, 'runs': 1, **run_record['resources']})
+		return rows
+	with ThreadPoolExecutor() as executor:
+		rows = [row for rows_of_measurement in executor.map(read_resources_of_measurement, measurements) for row in rows_of_measurement]
+	if group_by is not None:
+		groups = dict()
+		for row in rows:
+			group = groups.setdefault(row[group_by], {group_by: row[group_by], 'runs': 0, **{r: None for r in RESOURCES}, 'shared_process': False})
+			group['runs'] += 1
+			group['shared_process'] = group['shared_process'] or row.get('shared_process', False)
+			for r in RESOURCES:
+				if row.get(r) is not None:
+					group[r] = row[r] if group[r] is None else (max if r == 'peak_rss' else sum)([group[r], row[r]])
+		rows = list(groups.values())
+	return sorted(rows, key=lambda row: -1 if row.get(sort_by) is None else row[sort_by], reverse=True)
+
+def _read_run_status_from_output_directory(path_to_output_directory:Path) -> bool:
+	"""Reads the files left by a bureaucrat in `path_to_output_directory`
+	and returns `True` if the script ended without errors, `False` 
+	otherwise (either ended with errors or was not run at all).
+	"""
+	run_record = read_run_record(path_to_output_directory)
+	if run_record is not None:
+		return run_record['run_status'] == 'no errors'
+	# If we are here, this was done by an older bureaucrat...
+	try:
+		with open(path_to_output_directory/Path(ERRORS_REPORT_FILE_NAME), 'r') as ifile:
+			for line in ifile:
+				if 'run_status: no errors' in line:
+					return True
+	except FileNotFoundError:
+		pass
+	for fname in ['script_successfully_applied','.script_successfully_applied']: # Compatibility with older bureaucrats...
+		if (path_to_output_directory/Path(fname)).is_file():
+			return True
+	return False
+
+def _read_run_statuses_of_measurement(measurement_base_path:Path, task_names:set) -> dict:
+	"""Same as `_read_run_status_from_output_directory` for many tasks in
+	the same measurement at once. The measurement directory is listed
+	only once, so tasks that were never run cost nothing."""
+	try:
+		with os.scandir(measurement_base_path) as entries:
+			existing_directories = {entry.name for entry in entries if entry.is_dir()}
+	except (FileNotFoundError, NotADirectoryError):
+		existing_directories = set()
+	return {task_name: task_name in existing_directories and _read_run_status_from_output_directory(measurement_base_path/Path(task_name)) for task_name in task_names}
+
+def tasks_were_applied_without_errors(measurements_base_paths, task_names, max_workers:int=None) -> dict:
+	"""Checks many tasks on many measurements at once, which is much 
+	faster than calling `task_was_applied_without_errors` in a loop. 
+	Everything that can be answered by the index of each tree is answered
+	with a single query per tree, and the rest is looked for in the file
+	system in parallel.
+	
+	Parameters
+	----------
+	measurements_base_paths: iterable of Path
+		Paths to the measurements to check.
+	task_names: iterable of str
+		Names of the tasks (i.e. of their output directories) to check for.
+	max_workers: int, optional
+		Number of threads for accessing the file system, by default what
+		`concurrent.futures.ThreadPoolExecutor` decides.
+	
+	Returns
+	-------
+	statuses: dict
+		A dictionary of the form `{measurement_base_path: {task_name: bool}}`
+		where the bool is `True` if the task was applied without errors
+		on the measurement and `False` otherwise.
+	"""
+	if isinstance(task_names, str): # This is to make it more practical...
+		task_names = [task_names]
+	measurements_base_paths = list(measurements_base_paths)
+	task_names = list(task_names)
+	for measurement_base_path in measurements_base_paths:
+		if not isinstance(measurement_base_path, Path):
+			raise TypeError(f'`measurements_base_paths` must contain instances of {Path}, received object of type {type(measurement_base_path)}.')
+	
+	statuses = {measurement_base_path: dict() for measurement_base_path in measurements_base_paths}
+	trees = dict()
+	for measurement_base_path in measurements_base_paths:
+		trees.setdefault(find_root_measurement(measurement_base_path), []).append(measurement_base_path)
+	for path_to_root_measurement, measurements_in_tree in trees.items():
+		if not (path_to_root_measurement/Path(INDEX_FILE_NAME)).is_file():
+			continue
+		for (measurement_base_path, task_name), run_status in MeasurementsTreeIndex(path_to_root_measurement).run_statuses(measurements_in_tree, task_names).items():
+			if run_status is not None and run_status != 'running':
+				statuses[measurement_base_path][task_name] = run_status == 'no errors'
+	
+	not_in_index = {measurement_base_path: set(task_names) - set(statuses[measurement_base_path]) for measurement_base_path in measurements_base_paths}
+	not_in_index = {m: t for m,t in not_in_index.items() if len(t) > 0}
+	if len(not_in_index) > 0:
+		with ThreadPoolExecutor(max_workers=max_workers) as executor:
+			futures = {measurement_base_path: executor.submit(_read_run_statuses_of_measurement, measurement_base_path, tasks) for measurement_base_path, tasks in not_in_index.items()}
+			for measurement_base_path, future in futures.items():
+				statuses[measurement_base_path].update(future.result())
+	return {measurement_base_path: {task_name: statuses[measurement_base_path][task_name] for task_name in task_names} for measurement_base_path in measurements_base_paths}
+
+# The loaders use `open_compressed_for_reading` so compressed files (see `open_output`) are read transparently, and it uses `fpath.open` instead of `open(fpath)` so they also work with paths within archives, see `MeasurementArchive`.
+
+def _load_text(fpath:Path) -> str:
+	with open_compressed_for_reading(fpath, 'r') as ifile:
+		return ifile.read()
+
+def _load_csv(fpath:Path):
+	try:
+		import pandas
+	except ImportError: # Without pandas we give a list of dictionaries, one per row.
+		with open_compressed_for_reading(fpath, 'r') as ifile:
+			return list(csv.DictReader(ifile))
+	with open_compressed_for_reading(fpath, 'r') as ifile:
+		return pandas.read_csv(ifile)
+
+def _load_numpy(fpath:Path):
+	import numpy # Only needed if this loader is used.
+	with open_compressed_for_reading(fpath, 'rb') as ifile:
+		if ifile.read(6) == b'\x93NUMPY':
+			ifile.seek(0)
+			return numpy.load(ifile, allow_pickle=False)
+	with open_compressed_for_reading(fpath, 'r') as ifile:
+		return numpy.loadtxt(ifile)
+
+GATHER_LOADERS = {
+	'text': _load_text,
+	'csv': _load_csv,
+	'numpy': _load_numpy,
+}
+
+def _combine_gathered(gathered:dict):
+	"""Combines the values loaded from each submeasurement, see
+	`NamedTaskBureaucrat.gather_from_submeasurements`."""
+	values = list(gathered.values())
+	if len(values) > 0 and all(hasattr(v, 'columns') and hasattr(v, 'dtypes') for v in values): # Dataframes, e.g. pandas.
+		import pandas # If we are here, it is because there are pandas objects.
+		return pandas.concat([v.assign(submeasurement_name=name) for name, v in gathered.items()], ignore_index=True)
+	if len(values) > 0 and all(isinstance(v, list) and all(isinstance(row, dict) for row in v) for v in values): # Rows of a CSV file without pandas.
+		return [{'submeasurement_name': name, **row} for name, rows in gathered.items() for row in rows]
+	if len(values) > 0 and all(hasattr(v, 'shape') and hasattr(v, 'dtype') for v in values) and len({(v.shape, v.dtype) for v in values}) == 1: # Arrays, e.g. NumPy.
+		import numpy # If we are here, it is because there are NumPy objects.
+		combined = numpy.empty(len(values), dtype=[('submeasurement_name', f'U{max(len(name) for name in gathered)}'), ('value', values[0].dtype, values[0].shape)])
+		combined['submeasurement_name'] = list(gathered)
+		combined['value'] = numpy.stack(values) if len(values[0].shape) > 0 else values
+		return combined
+	return gathered
+
+class MeasurementsTreeIndex:
+	"""A persistent index of a whole measurement tree (a measurement, its
+	submeasurements, their submeasurements, etc.) stored as an SQLite 
+	file in the top level measurement directory. It keeps track of all 
+	the measurements, the output directory of each task that was run on
+	them and its run status, so questions like "which are the 
+	submeasurements of this measurement?" can be answered without walking
+	the directories, which is very slow for big trees in network file 
+	systems.
+	
+	Measurements are stored by their path relative to the root measurement,
+	the root itself being `'.'`. The run status of each task is one of 
+	`'running'`, `'no errors'` or `'there were errors'`, or `None` if 
+	it is not known. The local variables of each task that are numbers
+	or strings are also stored, so measurements can be searched by them
+	with `find_measurements`.
+	
+	If the tree is modified by hand (i.e. not by a bureaucrat) the index
+	may become outdated, use `verify` to check it and `rebuild` to fix it.
+	"""
+	DEFERRED_WRITES_MAX_NUMBER = 1000 # See `register_task`.
+	DEFERRED_WRITES_MAX_AGE = 1 # Seconds, see `register_task`.
+	
+	def __init__(self, path_to_root_measurement:Path):
+		"""Create an instance of `MeasurementsTreeIndex`.
+		
+		Parameters
+		----------
+		path_to_root_measurement: Path
+			Path to the top level measurement of the tree.
+		"""
+		if not isinstance(path_to_root_measurement, Path):
+			raise TypeError(f'`path_to_root_measurement` must be an instance of {Path}, received object of type {type(path_to_root_measurement)}.')
+		self._path_to_root_measurement = path_to_root_measurement
+		self._connections = threading.local() # One connection per thread, SQLite connections cannot be shared between threads.
+		self._deferred_writes = []
+		self._deferred_writes_lock = threading.Lock()
+		if not self.path_to_index_file.is_file(): # Create it.
+			with self._connect(create=True) as connection:
+				connection.execute('CREATE TABLE IF NOT EXISTS measurements (path TEXT PRIMARY KEY, parent TEXT, created_by_task TEXT)')
+				connection.execute('CREATE TABLE IF NOT EXISTS tasks (measurement TEXT, task TEXT, run_status TEXT, last_update TEXT, PRIMARY KEY (measurement, task))')
+				connection.execute('CREATE TABLE IF NOT EXISTS parameters (measurement TEXT, task TEXT, name TEXT, value, PRIMARY KEY (measurement, task, name))')
+				connection.execute('CREATE INDEX IF NOT EXISTS measurements_by_parent ON measurements (parent)')
+				connection.execute('CREATE INDEX IF NOT EXISTS tasks_by_task ON tasks (task)')
+				connection.execute('CREATE INDEX IF NOT EXISTS parameters_by_value ON parameters (name, value)')
+				connection.execute("INSERT OR IGNORE INTO measurements VALUES ('.', NULL, NULL)")
+	
+	def __getstate__(self):
+		self.flush()
+		state = self.__dict__.copy()
+		del state['_connections'] # Connections and locks cannot be sent to other processes.
+		del state['_deferred_writes_lock']
+		return state
+	
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._connections = threading.local()
+		self._deferred_writes_lock = threading.Lock()
+	
+	@classmethod
+	def of_measurement(cls, measurement_base_path:Path):
+		"""Returns the index of the tree to which the measurement in 
+		`measurement_base_path` belongs, or `None` if such tree has no
+		index.
+		"""
+		path_to_root_measurement = find_root_measurement(measurement_base_path)
+		if (path_to_root_measurement/Path(INDEX_FILE_NAME)).is_file():
+			return cls(path_to_root_measurement)
+		return None
+	
+	@property
+	def path_to_root_measurement(self) -> Path:
+		"""Path to the top level measurement of the tree."""
+		return self._path_to_root_measurement
+	
+	@property
+	def path_to_index_file(self) -> Path:
+		"""Path to the SQLite file with the index."""
+		return self.path_to_root_measurement/Path(INDEX_FILE_NAME)
+	
+	def _connect(self, create:bool=False):
+		"""Returns a context manager with a connection to the index, 
+		which is committed (or rolled back) when the `with` block ends. 
+		The connection is reused by the following calls from the same 
+		thread."""
+		connection = getattr(self._connections, 'connection', None)
+		if connection is None or self._connections.pid != os.getpid(): # A connection cannot be used after forking.
+			connection = sqlite3.connect(f'{self.path_to_index_file.absolute().as_uri()}?mode={"rwc" if create else "rw"}', uri=True, timeout=60) # With `mode=rw` SQLite does not create an empty file if the index was deleted.
+			self._connections.connection = connection
+			self._connections.pid = os.getpid()
+		self._write_deferred(connection)
+		return _ConnectionContext(connection)
+	
+	def _write_deferred(self, connection):
+		# Before anything else, so whatever is read or written next sees them.
+		with self._deferred_writes_lock:
+			deferred_writes, self._deferred_writes = self._deferred_writes, []
+		for method, args in deferred_writes:
+			method(connection, *args)
+	
+	def flush(self):
+		"""Writes the deferred registrations (see `register_task`) into
+		the index."""
+		if len(self._deferred_writes) > 0:
+			with self._connect():
+				pass
+	
+	def _relative_path(self, measurement_base_path:Path) -> str:
+		relative_path = measurement_base_path.relative_to(self.path_to_root_measurement)
+		return relative_path.as_posix() # Gives `'.'` for the root.
+	
+	def _register_measurement(self, connection, measurement_base_path:Path):
+		path = self._relative_path(measurement_base_path)
+		if path == '.':
+			return
+		connection.execute(
+			'INSERT OR REPLACE INTO measurements VALUES (?, ?, ?)',
+			(path, self._relative_path(measurement_base_path.parent.parent.parent), measurement_base_path.parent.parent.name),
+		)
+	
+	def _register_task(self, connection, measurement_base_path:Path, task_name:str, run_status:str, parameters:dict=None, last_update:str=None):
+		connection.execute(
+			'INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?)',
+			(self._relative_path(measurement_base_path), task_name, run_status, last_update or str(datetime.datetime.now())),
+		)
+		if parameters is not None:
+			connection.execute('DELETE FROM parameters WHERE measurement = ? AND task = ?', (self._relative_path(measurement_base_path), task_name))
+			connection.executemany(
+				'INSERT INTO parameters VALUES (?, ?, ?, ?)',
+				[(self._relative_path(measurement_base_path), task_name, name, value) for name, value in parameters.items()],
+			)
+	
+	def register_measurement(self, measurement_base_path:Path):
+		"""Adds a measurement to the index. If it is a submeasurement, its
+		parent measurement has to be in the tree."""
+		with self._connect() as connection:
+			self._register_measurement(connection, measurement_base_path)
+	
+	def register_task(self, measurement_base_path:Path, task_name:str, run_status:str, parameters:dict=None, register_measurement:bool=False, defer:bool=False):
+		"""Adds or updates the run status of the task whose output directory
+		is named `task_name` in the measurement `measurement_base_path`.
+		If `parameters` is given, it has to be a dictionary with numbers
+		or strings and replaces the parameters stored for this task. If
+		`register_measurement` is `True`, the measurement is also added
+		(see `register_measurement`) in the same transaction.
+		
+		If `defer` is `True`, this is written later together with other
+		deferred registrations in a single transaction, which is much
+		faster when registering many submeasurements. They are written
+		when there are `DEFERRED_WRITES_MAX_NUMBER` of them or the oldest
+		one is `DEFERRED_WRITES_MAX_AGE` seconds old, with the next use
+		of the index from this instance, or with `flush`. Meanwhile they 
+		are not visible from other instances, e.g. other processes, and 
+		if the process crashes they are lost."""
+		if run_status not in {None, 'running', 'no errors', 'there were errors'}:
+			raise ValueError(f'Invalid `run_status` {repr(run_status)}.')
+		writes = []
+		if register_measurement:
+			writes.append((self._register_measurement, (measurement_base_path,)))
+		writes.append((self._register_task, (measurement_base_path, task_name, run_status, parameters, str(datetime.datetime.now()))))
+		with self._deferred_writes_lock:
+			if len(self._deferred_writes) == 0:
+				self._oldest_deferred_write = time.monotonic()
+			self._deferred_writes += writes
+			n_deferred_writes = len(self._deferred_writes)
+		if not defer or n_deferred_writes >= self.DEFERRED_WRITES_MAX_NUMBER or time.monotonic() - self._oldest_deferred_write > self.DEFERRED_WRITES_MAX_AGE:
+			self.flush()
+	
+	def forget_submeasurements_of_task(self, measurement_base_path:Path, task_name:str):
+		"""Removes from the index all the submeasurements (and all their
+		descendants) that were created by the task `task_name` in the 
+		measurement `measurement_base_path`. Use this when such
+		submeasurements are deleted."""
+		prefix = (measurement_base_path/Path(task_name)/Path('submeasurements')).relative_to(self.path_to_root_measurement).as_posix() + '/'
+		with self._connect() as connection:
+			connection.execute('DELETE FROM tasks WHERE substr(measurement, 1, ?) = ?', (len(prefix), prefix))
+			connection.execute('DELETE FROM parameters WHERE substr(measurement, 1, ?) = ?', (len(prefix), prefix))
+			connection.execute('DELETE FROM measurements WHERE substr(path, 1, ?) = ?', (len(prefix), prefix))
+	
+	def run_status(self, measurement_base_path:Path, task_name:str):
+		"""Returns the run status of the task whose output directory is
+		named `task_name` in the measurement `measurement_base_path`, or
+		`None` if it is not known."""
+		with self._connect() as connection:
+			row = connection.execute(
+				'SELECT run_status FROM tasks WHERE measurement = ? AND task = ?',
+				(self._relative_path(measurement_base_path), task_name),
+			).fetchone()
+		return None if row is None else row[0]
+	
+	def run_statuses(self, measurements_base_paths:list, task_names:list) -> dict:
+		"""Same as `run_status` for many measurements and tasks with a 
+		single query. Returns a dictionary of the form 
+		`{(measurement_base_path, task_name): run_status}` with only the
+		pairs that are in the index."""
+		measurements = {self._relative_path(measurement_base_path): measurement_base_path for measurement_base_path in measurements_base_paths}
+		task_names = list(set(task_names))
+		with self._connect() as connection:
+			rows = connection.execute(
+				f'SELECT measurement, task, run_status FROM tasks WHERE task IN ({",".join("?"*len(task_names))})',
+				task_names,
+			).fetchall()
+		return {(measurements[measurement], task): run_status for measurement, task, run_status in rows if measurement in measurements}
+	
+	def submeasurements_of(self, measurement_base_path:Path) -> dict:
+		"""Returns a dictionary of the form `{task_name: {submeasurement_name: Path}}`
+		with the first level submeasurements of the measurement 
+		`measurement_base_path`."""
+		with self._connect() as connection:
+			rows = connection.execute(
+				'SELECT path, created_by_task FROM measurements WHERE parent = ?',
+				(self._relative_path(measurement_base_path),),
+			).fetchall()
+		submeasurements = {}
+		paths_to_submeasurements_directories = {}
+		for path, created_by_task in rows:
+			submeasurement_name = path.split('/')[-1]
+			if created_by_task not in submeasurements:
+				submeasurements[created_by_task] = dict()
+				paths_to_submeasurements_directories[created_by_task] = measurement_base_path/Path(created_by_task)/Path('submeasurements') # Only once per task, creating `Path`s is not free.
+			submeasurements[created_by_task][submeasurement_name] = paths_to_submeasurements_directories[created_by_task]/submeasurement_name
+		return submeasurements
+	
+	def submeasurements_tree(self, measurement_base_path:Path) -> dict:
+		"""Same as `find_submeasurements_recursively` but using the index."""
+		with self._connect() as connection:
+			rows = connection.execute('SELECT path, parent FROM measurements WHERE parent IS NOT NULL').fetchall()
+		children = {}
+		for path, parent in rows:
+			children.setdefault(parent, []).append(path)
+		def build_tree(path:Path):
+			relative_path = self._relative_path(path)
+			if relative_path not in children:
+				return None
+			return {str(path): {str(p): build_tree(p) for p in [self.path_to_root_measurement/Path(c) for c in children[relative_path]]}}
+		return build_tree(measurement_base_path)
+	
+	def _scan(self) -> tuple:
+		"""Walks the tree in the file system and returns three sets, with
+		the rows for the `measurements`, `tasks` (excluding the last 
+		update column) and `parameters` tables."""
+		measurements = set()
+		tasks = set()
+		parameters = set()
+		def scan(measurement_base_path:Path):
+			for p in measurement_base_path.iterdir():
+				if not p.is_dir() or p.name in {SCRIPTS_BACKUPS_DIRECTORY_NAME, TRASH_DIRECTORY_NAME, GATHER_CACHE_DIRECTORY_NAME, PUBLISHING_DIRECTORY_NAME}:
+					continue
+				tasks.add((self._relative_path(measurement_base_path), p.name, 'no errors' if _read_run_status_from_output_directory(p) else 'there were errors'))
+				try:
+					with open(p/Path(LOCALS_FILE_NAME), 'r') as ifile:
+						parameters.update((self._relative_path(measurement_base_path), p.name, name, value) for name, value in _scalar_locals(json.load(ifile)).items())
+				except (FileNotFoundError, json.JSONDecodeError): # Older bureaucrats did not leave this file.
+					pass
+				if (p/Path('submeasurements')).is_dir():
+					for pp in (p/Path('submeasurements')).iterdir():
+						if pp.is_dir():
+							measurements.add((self._relative_path(pp), self._relative_path(measurement_base_path), p.name))
+							scan(pp)
+		scan(self.path_to_root_measurement)
+		return measurements, tasks, parameters
+	
+	def rebuild(self):
+		"""Discards all the content of the index and creates it again by
+		walking the tree in the file system. Tasks for which no successful
+		run is found are stored as `'there were errors'`."""
+		measurements, tasks, parameters = self._scan()
+		now = str(datetime.datetime.now())
+		with self._connect() as connection:
+			connection.execute('DELETE FROM tasks')
+			connection.execute('DELETE FROM parameters')
+			connection.execute("DELETE FROM measurements WHERE path != '.'")
+			connection.executemany('INSERT INTO measurements VALUES (?, ?, ?)', measurements)
+			connection.executemany('INSERT INTO tasks VALUES (?, ?, ?, ?)', [t + (now,) for t in tasks])
+			connection.executemany('INSERT INTO parameters VALUES (?, ?, ?, ?)', parameters)
+	
+	def verify(self) -> bool:
+		"""Walks the tree in the file system and compares it with the 
+		index. Returns `True` if they agree, `False` otherwise."""
+		measurements, tasks, parameters = self._scan()
+		with self._connect() as connection:
+			indexed_measurements = set(connection.execute("SELECT path, parent, created_by_task FROM measurements WHERE path != '.'").fetchall())
+			indexed_tasks = set(connection.execute('SELECT measurement, task, run_status FROM tasks').fetchall())
+			indexed_parameters = set(connection.execute('SELECT measurement, task, name, value FROM parameters').fetchall())
+		indexed_tasks = {(m,t,'there were errors' if s in {None,'running'} else s) for m,t,s in indexed_tasks}
+		parameters = {(m,t,n,int(v) if isinstance(v, bool) else v) for m,t,n,v in parameters} # SQLite stores booleans as integers.
+		return measurements == indexed_measurements and tasks == indexed_tasks and parameters == indexed_parameters
+	
+	def find_measurements(self, conditions:dict, task_name:str=None, within:Path=None) -> list:
+		"""Returns the paths of the measurements in which some task was run
+		with local variables that fulfill all the `conditions`.
+		
+		Parameters
+		----------
+		conditions: dict
+			A dictionary with the name of the variables as keys and either
+			a value, meaning that the variable has to be equal to it, or a
+			tuple `(operator, value)` where `operator` is one of `'=='`, 
+			`'!='`, `'<'`, `'<='`, `'>'`, `'>='` or `'in'` (then `value` is
+			a list of values). For example `{'n_steps': 5, 'voltage': ('>', 10)}`.
+		task_name: str, optional
+			If given, only the local variables of this task are considered.
+		within: Path, optional
+			If given, only this measurement and its submeasurements (and
+			their submeasurements, etc.) are considered.
+		"""
+		if not isinstance(conditions, dict):
+			raise TypeError(f'`conditions` must be an instance of {dict}, received object of type {type(conditions)}.')
+		if len(conditions) == 0:
+			raise ValueError(f'`conditions` is empty.')
+		OPERATORS = {'==': '=', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+		joins = []
+		where = []
+		arguments = []
+		for n, (name, condition) in enumerate(conditions.items()):
+			operator, value = condition if isinstance(condition, tuple) else ('==', condition)
+			if n > 0:
+				joins.append(f'JOIN parameters p{n} ON p{n}.measurement = p0.measurement AND p{n}.task = p0.task')
+			where.append(f'p{n}.name = ?')
+			arguments.append(name)
+			if operator == 'in':
+				values = list(value)
+				where.append(f'p{n}.value IN ({",".join("?"*len(values))})')
+				arguments += values
+			elif operator in OPERATORS:
+				if not isinstance(value, (bool, int, float, str)):
+					raise TypeError(f'The values in `conditions` must be numbers or strings, received object of type {type(value)} for {repr(name)}.')
+				where.append(f'p{n}.value {OPERATORS[operator]} ?')
+				arguments.append(value)
+				if operator not in {'==', '!='}: # Otherwise SQLite says that any string is greater than any number.
+					where.append(f"typeof(p{n}.value) {'=' if isinstance(value, str) else '!='} 'text'")
+			else:
+				raise ValueError(f'Invalid operator {repr(operator)} for {repr(name)}, must be one of {sorted(OPERATORS) + ["in"]}.')
+		if task_name is not None:
+			where.append('p0.task = ?')
+			arguments.append(task_name)
+		if within is not None and self._relative_path(within) != '.':
+			prefix = self._relative_path(within)
+			where.append('(p0.measurement = ? OR substr(p0.measurement, 1, ?) = ?)')
+			arguments += [prefix, len(prefix)+1, prefix+'/']
+		with self._connect() as connection:
+			rows = connection.execute(
+				f'SELECT DISTINCT p0.measurement FROM parameters p0 {" ".join(joins)} WHERE {" AND ".join(where)}',
+				arguments,
+			).fetchall()
+		return sorted(self.path_to_root_measurement/Path(measurement) for measurement, in rows)
+
+class _ConnectionContext:
+	"""Commits (or rolls back) an SQLite connection when the `with` block
+	ends. The connection is not closed, so it can be reused."""
+	def __init__(self, connection):
+		self._connection = connection
+	
+	def __enter__(self):
+		return self._connection
+	
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		if exc_type is None:
+			self._connection.commit()
+		else:
+			self._connection.rollback()
+
 class SmarterBureaucrat:
 	"""Let a `SmartBureaucrat` ease your life by doing all the boring stuff
 	while you focus on the important things.
 	"""
-	def __init__(self, measurement_base_path:Path, _locals:dict=None, new_measurement=False):
+	LOCALS_REPR_MAX_LENGTH = 1000 # Maximum number of characters for each local variable in the backup of the script, see `summarize_local`.
+	LOCALS_FILE_MAX_LENGTH = 10000 # Local variables that can be stored as JSON within this number of characters are also stored in `SmarterBureaucrat_locals.json`.
+	LOCK_HEARTBEAT_PERIOD = 10 # Seconds between updates of the lock file while the bureaucrat is doing its magic.
+	LOCK_STALE_AFTER = 120 # Seconds without heartbeat after which a lock is considered abandoned, e.g. because the computer that had it crashed.
+	_is_light_submeasurement = False # See `create_submeasurement`.
+	_batch_index_writes = False # See `create_submeasurement`.
+	
+	def __init__(self, measurement_base_path:Path, _locals:dict=None, new_measurement=False, deduplicate_script_backup:bool=False):
 		"""Create an instance of `Bureaucrat`.
 		
 		Parameters
@@ -46,6 +1054,15 @@ class SmarterBureaucrat:
 			created in the past, for example you will now analyze this 
 			data with another script. If `True` then a new directory
 			will be created as the root directory for a new measurement.
+		deduplicate_script_backup: bool, default `False`
+			If `True`, the backup of the script is stored only once per
+			content in the directory `SmarterBureaucrat_scripts_backups`
+			of the top level measurement and the output directory gets 
+			a hard link to it (or a small pointer file if hard links are
+			not possible). The local variables are then stored in the 
+			run record instead of in the backup. Use this for scripts that
+			create many submeasurements, to avoid thousands of identical
+			files.
 		"""
 		if _locals is None: # Explain how to use this workaround thing...
 			raise ValueError(f'''When you create your bureaucrat please do it in this way:
@@ -54,10 +1071,12 @@ bureaucrat = Bureaucrat(
 	_locals = locals(),
 )
 ''')
-		if not isinstance(measurement_base_path, Path):
+		if not isinstance(measurement_base_path, (Path, zipfile.Path)):
 			raise TypeError(f'`measurement_base_path` must be an instance of {Path}, received object of type {type(measurement_base_path)}.')
 		if not isinstance(new_measurement, bool):
 			raise TypeError(f'`new_measurement` must be `True` or `False`.')
+		if not isinstance(deduplicate_script_backup, bool):
+			raise TypeError(f'`deduplicate_script_backup` must be `True` or `False`.')
 		
 		if ' ' in str(measurement_base_path):
 			warnings.warn(f'The `measurement_base_path` contains blank spaces. I can handle this, but it is always better to aviod them.')
@@ -67,30 +1086,42 @@ bureaucrat = Bureaucrat(
 		
 		self._datetime_bureaucrat_was_born = datetime.datetime.now()
 		
-		self._path_to_the_script_that_created_this_bureaucrat = Path.cwd()/Path(inspect.currentframe().f_back.f_code.co_filename)
+		frame = inspect.currentframe()
+		while frame.f_code.co_filename == __file__: # Skip the `__init__` of subclasses, we want the user's script.
+			frame = frame.f_back
+		self._path_to_the_script_that_created_this_bureaucrat = Path.cwd()/Path(frame.f_code.co_filename)
 		
 		self._new_measurement = new_measurement
 		
 		if new_measurement == True:
-			self._measurement_base_path = measurement_base_path.parent/Path(f'{self.birth_datetime.strftime("%Y%m%d%H%M%S")}_{measurement_base_path.parts[-1]}')
+			self._requested_measurement_base_path = measurement_base_path
+			self._measurement_base_path = _timestamped_path(measurement_base_path, self.birth_datetime)
 		else: # if not a new measurement...
+			from bureaucrat.MeasurementArchive import MeasurementArchive # Here because it imports this module.
+			if MeasurementArchive.is_archive(measurement_base_path): # Read only access, see `MeasurementArchive`.
+				if isinstance(measurement_base_path, zipfile.Path):
+					self._archive = MeasurementArchive.of_path(measurement_base_path)
+				else:
+					self._archive = MeasurementArchive.open(measurement_base_path)
+					measurement_base_path = self._archive.path_to_root_measurement
 			if not measurement_base_path.is_dir():
 				raise FileNotFoundError(f'Directory {measurement_base_path} does not exist.')
 			self._measurement_base_path = measurement_base_path
 		
 		self._backup_script_file_name = f'backup.{self._path_to_the_script_that_created_this_bureaucrat.parts[-1]}'
-		self._make_backup_of_calling_script_file(
-			_locals = _locals, 
-			fpath = self.path_to_temporary_directory/Path(self._backup_script_file_name),
-		)
+		self._deduplicate_script_backup = deduplicate_script_backup
+		self._locals = dict(_locals) # The backup is done when the magic starts, if it ever starts, so here we only keep the variables. Note that objects modified in between will be backed up as they are when the magic starts.
 	
-	def do_your_magic(self, clean_default_output_directory:bool=True):
+	def do_your_magic(self, clean_default_output_directory:bool=True, clean_in_background:bool=False, stage_locally:bool=False, path_to_staging_directory:Path=None, publish_on_errors:bool=False):
 		"""Use this method to enter into a `with` statement (with the
 		bureaucrat as the context manager). For example
 		```
 		with my_bureaucrat.do_your_magic(...):
 			do_stuff()
 		```
+		In `asyncio` code use `async with my_bureaucrat.do_your_magic(...):`
+		instead, then all the work of the bureaucrat with the files is
+		done in a thread and the event loop is not blocked.
 		
 		Parameters
 		----------
@@ -102,9 +1133,42 @@ bureaucrat = Bureaucrat(
 			or so) and you want to remove all the previous products of such
 			script, or maybe for some reason you don't want to remove such
 			old data.
+		clean_in_background: bool, default `False`
+			If `True`, the old contents of the output directory are moved
+			away and deleted by a background thread, so your script starts
+			right away instead of waiting for the deletion. See 
+			`clean_default_output_directory`.
+		stage_locally: bool, default `False`
+			If `True`, `path_to_default_output_directory` points to a 
+			directory in a fast local disk while the bureaucrat is doing its
+			magic, and everything is moved to the actual output directory 
+			at the end, replacing the old output. Meanwhile, everybody else
+			sees the old output, so other scripts never see the output of 
+			a task half done. Use this when the measurement is in a slow 
+			network file system and the task writes many files. If the
+			staging directory and the measurement are in the same file
+			system the output is moved by renaming it, which takes no time, 
+			otherwise it is copied in parallel. Submeasurements cannot be 
+			created while staging. If the task ends with errors, the old 
+			output is kept and the output of the failed run is left in the
+			staging directory, see `publish_on_errors`.
+		path_to_staging_directory: Path, optional
+			Where to put the staging directory if `stage_locally` is `True`,
+			by default in `path_to_temporary_directory`.
+		publish_on_errors: bool, default `False`
+			If `True` and `stage_locally` is `True`, the output is published
+			even if the task ended with errors, replacing the old output.
 		"""
 		if clean_default_output_directory not in {True, False}:
 			raise ValueError(f'`clean_default_output_directory` must be `True` or `False`, received {clean_default_output_directory}.')
+		if clean_in_background not in {True, False}:
+			raise ValueError(f'`clean_in_background` must be `True` or `False`, received {clean_in_background}.')
+		if stage_locally not in {True, False}:
+			raise ValueError(f'`stage_locally` must be `True` or `False`, received {stage_locally}.')
+		if path_to_staging_directory is not None and not isinstance(path_to_staging_directory, Path):
+			raise TypeError(f'`path_to_staging_directory` must be an instance of {Path}, received object of type {type(path_to_staging_directory)}.')
+		if publish_on_errors not in {True, False}:
+			raise ValueError(f'`publish_on_errors` must be `True` or `False`, received {publish_on_errors}.')
 		
 		if not hasattr(self, '_do_your_magic_parameters'):
 			self._do_your_magic_parameters = locals() # All the arguments of the function will be catched here.
@@ -115,28 +1179,113 @@ bureaucrat = Bureaucrat(
 	def __enter__(self):
 		if not hasattr(self, '_do_your_magic_parameters'):
 			raise RuntimeError(f'Before doing `with your_bureaucrat:` you have to call `your_bureaucrat.do_your_magic`. A one liner is `with your_bureaucrat.do_your_magic(...):`')
+		if hasattr(self, '_archive'):
+			raise RuntimeError(f'The measurement {repr(self.measurement_name)} is in the archive {self._archive.path_to_archive}, which is read only. Use `unpack_measurement` to run tasks on it.')
 		if hasattr(self, '_already_did_my_job'):
 			raise RuntimeError(f'You can only request your bureaucrats to do their job once. This one has already finished.')
 		if self._new_measurement:
-			if self.path_to_measurement_base_directory.is_dir():
-				raise RuntimeError(f'You told your bureaucrat that this is a new measurement, but the directory {self.path_to_measurement_base_directory} already exists...')
-			self.path_to_measurement_base_directory.mkdir(parents=True)
-		self.path_to_default_output_directory.mkdir(exist_ok=True)
-		if self._do_your_magic_parameters['clean_default_output_directory'] == True:
-			self.clean_default_output_directory()
+			while True:
+				try:
+					self.path_to_measurement_base_directory.mkdir(parents=True) # This is atomic, if two bureaucrats try to create the same directory only one succeeds.
+					break
+				except FileExistsError: # Someone else took this name, e.g. another process creating measurements at the same time.
+					self._measurement_base_path = _timestamped_path(self._requested_measurement_base_path, datetime.datetime.now())
+					if hasattr(self, '_path_to_default_output_directory'):
+						del self._path_to_default_output_directory
+			if find_root_measurement(self.path_to_measurement_base_directory) == self.path_to_measurement_base_directory:
+				self._measurements_tree_index = MeasurementsTreeIndex(self.path_to_measurement_base_directory) # New trees are always indexed.
+			# A new submeasurement is added to the index in `_start_magic`, together with its task, so it is a single transaction.
+		else: # In a new measurement nobody else can be running this task, but otherwise...
+			self._acquire_lock()
+		try:
+			self._start_magic()
+		except BaseException:
+			if self._new_measurement and not hasattr(self, '_registered_in_index') and self.measurements_tree_index is not None:
+				self.measurements_tree_index.register_measurement(self.path_to_measurement_base_directory) # The directory exists, so it has to be in the index anyway.
+			self._stop_monitoring_resources()
+			self._release_lock()
+			raise
 		return self
 	
+	def _start_magic(self):
+		self._datetime_magic_started = datetime.datetime.now()
+		self._resources_at_start = {'wall_time': time.perf_counter(), 'cpu_time': time.process_time(), 'cpu_time_thread': time.thread_time(), 'thread': threading.get_ident(), 'cpu_time_children': sum(os.times()[2:4]), 'max_rss': _peak_rss()}
+		self._rss_during_magic = _resources_monitor.start()
+		if self._do_your_magic_parameters['stage_locally'] == True:
+			self._path_to_published_output_directory = self.path_to_default_output_directory
+			path_to_staging_directory = self._do_your_magic_parameters['path_to_staging_directory'] or self.path_to_temporary_directory
+			path_to_staging_directory.mkdir(parents=True, exist_ok=True)
+			self._path_to_default_output_directory = Path(tempfile.mkdtemp(dir=path_to_staging_directory))/Path(self._path_to_published_output_directory.name) # Same name, it is the name of the task.
+			if self._do_your_magic_parameters['clean_default_output_directory'] == False and self._path_to_published_output_directory.is_dir(): # Start from the old output.
+				_copy_directory_in_parallel(self._path_to_published_output_directory, self.path_to_default_output_directory)
+			else: # The old output is replaced when publishing, so there is nothing to clean now.
+				self.path_to_default_output_directory.mkdir()
+		else:
+			self.path_to_default_output_directory.mkdir(exist_ok=True)
+			if self._do_your_magic_parameters['clean_default_output_directory'] == True and not self._new_measurement: # A new measurement has nothing to clean.
+				self.clean_default_output_directory(in_background=self._do_your_magic_parameters['clean_in_background'])
+		self._locals_reprs = {key: summarize_local(value, max_length=self.LOCALS_REPR_MAX_LENGTH) for key,value in self._locals.items()}
+		jsonable_locals = _jsonable_locals(self._locals, max_length=self.LOCALS_FILE_MAX_LENGTH)
+		self._locals_sha256 = _sha256_of_each_jsonable_local(jsonable_locals) # Now, for the fingerprint at the end, so they are not checked again.
+		_write_json_atomically(
+			data = jsonable_locals,
+			fpath = self.path_to_default_output_directory/Path(LOCALS_FILE_NAME),
+		)
+		if self.measurements_tree_index is not None:
+			self.measurements_tree_index.register_task(self.path_to_measurement_base_directory, self.path_to_default_output_directory.name, 'running', parameters=_scalar_locals(jsonable_locals), register_measurement=self._new_measurement) # Never deferred, so everybody sees the new measurement right away.
+			self._registered_in_index = True
+		if self._deduplicate_script_backup == True:
+			self._script_backup_sha256 = self._link_deduplicated_backup_of_calling_script_file()
+		else:
+			self._script_backup_sha256 = None
+			self._make_backup_of_calling_script_file(
+				fpath = self.path_to_default_output_directory/Path(self._backup_script_file_name),
+			)
+		if not self._is_light_submeasurement: # A new submeasurement is empty, so without a run record everybody knows it did not finish.
+			self._write_run_record(run_status='running') # So everybody knows, even if we did not clean the output directory.
+	
 	def __exit__(self, exc_type, exc_val, exc_tb):
 		self._already_did_my_job = True
-		(self.path_to_temporary_directory/Path(self._backup_script_file_name)).rename(self.path_to_default_output_directory/Path(self._backup_script_file_name)) # Move the backup script to the output directory.
-		with open(self.path_to_default_output_directory/Path('SmarterBureaucrat_errors_report.txt'), 'w') as ofile:
-			if all([exc is None for exc in [exc_type, exc_val, exc_tb]]): # This means there was no error, see https://docs.python.org/3/reference/datamodel.html#object.__exit__
-				print('run_status: no errors', file=ofile)
-				print(f'The sole purpose of this file is to indicate that this job was completed with no errors on {datetime.datetime.now()}.', file=ofile)
-			else: # If there was any kind of error...
-				print('run_status: there were errors', file=ofile)
-				print(f'If you are reading this it means that this script ended with errors on {datetime.datetime.now()}', file=ofile)
-		if self._new_measurement:
+		try:
+			self._finish_magic(exc_type, exc_val, exc_tb)
+		finally: # Even if something fails here, e.g. the task deleted its own output directory, the lock must not stay.
+			self._stop_monitoring_resources()
+			self._release_lock()
+	
+	def _finish_magic(self, exc_type, exc_val, exc_tb):
+		try:
+			self._close_chunked_writers()
+			error_closing_writers = None
+		except Exception as e: # The data is not complete, so the run cannot be considered successful.
+			error_closing_writers = e
+			if exc_type is None:
+				exc_type, exc_val, exc_tb = type(e), e, e.__traceback__
+		run_status = 'no errors' if all([exc is None for exc in [exc_type, exc_val, exc_tb]]) else 'there were errors' # No errors means all are `None`, see https://docs.python.org/3/reference/datamodel.html#object.__exit__
+		errors_report = [f'run_status: {run_status}']
+		if run_status == 'no errors':
+			errors_report.append(f'The sole purpose of this file is to indicate that this job was completed with no errors on {datetime.datetime.now()}.')
+		else: # If there was any kind of error...
+			errors_report.append(f'If you are reading this it means that this script ended with errors on {datetime.datetime.now()}')
+		for summary in getattr(self, '_submeasurements_runs_summaries', []):
+			errors_report += ['', summary]
+		_write_text_atomically('\n'.join(errors_report) + '\n', self.path_to_default_output_directory/Path(ERRORS_REPORT_FILE_NAME))
+		self._write_run_record(run_status=run_status, exc_type=exc_type)
+		error_publishing = None
+		if hasattr(self, '_path_to_published_output_directory'):
+			path_to_staged_output_directory = self.path_to_default_output_directory
+			if run_status == 'no errors' or self._do_your_magic_parameters['publish_on_errors'] == True:
+				try:
+					self._publish_staged_output_directory()
+				except Exception as e:
+					error_publishing = RuntimeError(f'Could not publish the output of the task into {self._path_to_published_output_directory}, it is still in {path_to_staged_output_directory}.')
+					error_publishing.__cause__ = e
+					run_status = 'there were errors'
+			else: # Downstream tasks must only see complete outputs, so the old one stays.
+				warnings.warn(f'The task ended with errors, so its output was not published into {self._path_to_published_output_directory}, which keeps the previous output (if any). The output of this run is in {path_to_staged_output_directory}.')
+				run_status = 'no errors' if _read_run_status_from_output_directory(self._path_to_published_output_directory) else 'there were errors' # For the index, that of the output that everybody sees.
+		if self.measurements_tree_index is not None:
+			self.measurements_tree_index.register_task(self.path_to_measurement_base_directory, self.path_to_default_output_directory.name, run_status, defer=self._batch_index_writes)
+		if self._new_measurement and not self._is_light_submeasurement: # Submeasurements are explained by the output of their parent.
 			with open(self.path_to_measurement_base_directory/Path('README.md'), 'w') as ofile:
 				print(f'# Measurement: {self.measurement_name}', file=ofile)
 				print('', file=ofile)
@@ -144,11 +1293,181 @@ bureaucrat = Bureaucrat(
 				print('', file=ofile)
 				print(f'- Measurement name: {self.measurement_name}', file=ofile)
 				print(f'- Measurement datetime: {self.birth_datetime}', file=ofile)
+		if error_closing_writers is not None and exc_val is error_closing_writers:
+			raise error_closing_writers
+		if error_publishing is not None:
+			raise error_publishing
+	
+	async def __aenter__(self):
+		# Creating directories, cleaning, backups, etc. take time, so they are done in a thread and the event loop keeps running.
+		await asyncio.to_thread(self.__enter__)
+		self._resources_at_start['thread'] = None # The task runs in the thread of the event loop, together with other coroutines, so there is no `cpu_time_thread`.
+		return self
+	
+	async def __aexit__(self, exc_type, exc_val, exc_tb):
+		return await asyncio.to_thread(self.__exit__, exc_type, exc_val, exc_tb)
+	
+	def _publish_staged_output_directory(self):
+		"""Replaces the output directory by the staging directory, see
+		`stage_locally` in `do_your_magic`."""
+		path_to_staged_output_directory = self.path_to_default_output_directory
+		path_to_output_directory = self._path_to_published_output_directory
+		token = f'{path_to_output_directory.name}_{datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")}_{os.getpid()}'
+		path_to_trash_directory = self.path_to_measurement_base_directory/Path(TRASH_DIRECTORY_NAME)
+		path_to_old_output_directory = None
+		if os.stat(path_to_staged_output_directory).st_dev != os.stat(self.path_to_measurement_base_directory).st_dev: # Different file systems, so we cannot just rename it.
+			path_to_incoming_directory = self.path_to_measurement_base_directory/Path(PUBLISHING_DIRECTORY_NAME)/Path(token)
+		else:
+			path_to_incoming_directory = path_to_staged_output_directory
+		try:
+			if path_to_incoming_directory != path_to_staged_output_directory:
+				path_to_incoming_directory.parent.mkdir(exist_ok=True)
+				_copy_directory_in_parallel(path_to_staged_output_directory, path_to_incoming_directory)
+			if path_to_output_directory.exists():
+				path_to_trash_directory.mkdir(exist_ok=True)
+				os.rename(path_to_output_directory, path_to_trash_directory/Path(token))
+				path_to_old_output_directory = path_to_trash_directory/Path(token)
+			os.rename(path_to_incoming_directory, path_to_output_directory) # Only between the two renames there is no output directory, but never a half done one.
+		except BaseException: # Leave everything as it was, the staged output is still where it was.
+			if path_to_old_output_directory is not None and not path_to_output_directory.exists():
+				os.rename(path_to_old_output_directory, path_to_output_directory)
+			if path_to_incoming_directory != path_to_staged_output_directory:
+				rmtree(path_to_incoming_directory, ignore_errors=True)
+			raise
+		if path_to_old_output_directory is not None:
+			self._cleanup_thread = threading.Thread(target=_empty_trash_directory, args=(path_to_trash_directory,)) # Not a daemon, so Python waits for it.
+			self._cleanup_thread.start()
+		if path_to_incoming_directory == path_to_staged_output_directory:
+			os.rmdir(path_to_staged_output_directory.parent)
+		else: # Only now, so if publishing failed the output of the task was still there.
+			rmtree(path_to_staged_output_directory.parent)
+		self._path_to_default_output_directory = path_to_output_directory
+		del self._path_to_published_output_directory
+		if self._do_your_magic_parameters['clean_default_output_directory'] == True and self.measurements_tree_index is not None:
+			self.measurements_tree_index.forget_submeasurements_of_task(self.path_to_measurement_base_directory, self.path_to_default_output_directory.name)
+	
+	def _write_run_record(self, run_status:str, exc_type=None):
+		_write_json_atomically(
+			data = {
+				'format_version': RUN_RECORD_FORMAT_VERSION,
+				'run_status': run_status,
+				'start': str(self._datetime_magic_started),
+				'end': None if run_status == 'running' else str(datetime.datetime.now()),
+				'exception_type': None if exc_type is None else exc_type.__name__,
+				'script_path': str(self._path_to_the_script_that_created_this_bureaucrat),
+				'task_name': self.path_to_default_output_directory.name,
+				'measurement_name': self.measurement_name,
+				'host': socket.gethostname(),
+				'pid': os.getpid(),
+				'submeasurements_runs': getattr(self, '_submeasurements_runs_summaries', []),
+				'locals': self._locals_reprs,
+				'script_backup_sha256': self._script_backup_sha256,
+				'fingerprint': None if run_status == 'running' else self._fingerprint(getattr(self, '_upstream_manifests', dict())),
+				'resources': None if run_status == 'running' else self._resources_used(),
+			},
+			fpath = self.path_to_default_output_directory/Path(RUN_RECORD_FILE_NAME),
+		)
+	
+	def _stop_monitoring_resources(self) -> dict:
+		if not hasattr(self, '_rss_during_magic'):
+			return None
+		return _resources_monitor.stop(self._rss_during_magic)
+	
+	def _resources_used(self) -> dict:
+		"""Returns the resources used since the bureaucrat started its 
+		magic, to be stored in the run record. `cpu_time` is that of all
+		the threads of this process, `cpu_time_thread` that of the thread
+		that did the magic (`None` if it started and ended in different
+		threads, e.g. with `async with`) and `cpu_time_children` that of 
+		the processes it created that already finished (e.g. those of 
+		`run_on_submeasurements`). `rss_at_start` and `peak_rss` are the
+		RAM used by the process when the magic started and its maximum 
+		during the magic, in bytes. `shared_process` is `True` if other 
+		bureaucrats were doing their magic in this process at the same 
+		time, so `cpu_time` and `peak_rss` are not only of this task. 
+		`bytes_written` and `files` are the size and number of files in 
+		the output directory at the end, not counting submeasurements."""
+		rss_during_magic = self._stop_monitoring_resources()
+		peak_rss = _peak_rss()
+		if peak_rss is None or self._resources_at_start['max_rss'] is None or peak_rss <= self._resources_at_start['max_rss']: # The maximum of the process was before the magic, so the peak during the magic is only known from the samples.
+			peak_rss = rss_during_magic['peak_rss']
+		bytes_written, files = _size_of_output_directory(self.path_to_default_output_directory)
+		return {
+			'wall_time': time.perf_counter() - self._resources_at_start['wall_time'],
+			'cpu_time': time.process_time() - self._resources_at_start['cpu_time'],
+			'cpu_time_thread': time.thread_time() - self._resources_at_start['cpu_time_thread'] if threading.get_ident() == self._resources_at_start['thread'] else None,
+			'cpu_time_children': sum(os.times()[2:4]) - self._resources_at_start['cpu_time_children'],
+			'rss_at_start': rss_during_magic['rss_at_start'],
+			'peak_rss': peak_rss,
+			'shared_process': rss_during_magic['shared_process'],
+			'bytes_written': bytes_written,
+			'files': files,
+		}
+	
+	@property
+	def _path_to_lock_file(self) -> Path:
+		return self.path_to_measurement_base_directory/Path(f'{LOCK_FILE_NAME_PREFIX}{self.path_to_default_output_directory.name}')
+	
+	def _acquire_lock(self):
+		"""Creates the lock file for the task of this bureaucrat on this
+		measurement, or raises `TaskAlreadyRunningError` if someone else
+		has it. Abandoned locks are removed. While the lock is held, a
+		thread updates its modification time as a heartbeat."""
+		self._lock = {'host': socket.gethostname(), 'pid': os.getpid(), 'since': str(datetime.datetime.now()), 'token': uuid.uuid4().hex}
+		while True:
+			try:
+				file_descriptor = os.open(self._path_to_lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY) # This is atomic, only one can create it.
+				break
+			except FileExistsError:
+				stale_lock = _read_lock(self._path_to_lock_file)
+				if not _lock_is_stale(self._path_to_lock_file, stale_after=self.LOCK_STALE_AFTER):
+					raise TaskAlreadyRunningError(f'The task {repr(self.path_to_default_output_directory.name)} is being run on measurement {repr(self.measurement_name)} by {stale_lock}.')
+				path_to_stale_lock = self._path_to_lock_file.parent/Path(f'.{self._path_to_lock_file.name}.{self._lock["token"]}.stale')
+				try:
+					os.rename(self._path_to_lock_file, path_to_stale_lock)
+				except FileNotFoundError: # Someone else removed it, try again.
+					continue
+				if _read_lock(path_to_stale_lock) != stale_lock: # Someone else replaced the stale lock with a good one in between, put it back.
+					os.rename(path_to_stale_lock, self._path_to_lock_file)
+					continue
+				path_to_stale_lock.unlink()
+		with os.fdopen(file_descriptor, 'w') as ofile:
+			json.dump(self._lock, ofile)
+		self._stop_heartbeat = threading.Event()
+		def heartbeat():
+			while not self._stop_heartbeat.wait(self.LOCK_HEARTBEAT_PERIOD):
+				try:
+					os.utime(self._path_to_lock_file)
+				except FileNotFoundError:
+					pass
+		threading.Thread(target=heartbeat, daemon=True).start()
+	
+	def _release_lock(self):
+		if not hasattr(self, '_lock'):
+			return
+		self._stop_heartbeat.set()
+		if _read_lock(self._path_to_lock_file) == self._lock: # Make sure we delete our lock and not someone else's.
+			self._path_to_lock_file.unlink()
+		del self._lock
+	
+	def script_is_running(self, script_name:str) -> bool:
+		"""Returns `True` if some bureaucrat, maybe in another process
+		or computer, is running the script named `script_name` on the
+		current measurement right now."""
+		if not isinstance(script_name, str) or script_name[-3:] != '.py':
+			raise ValueError(f'`script_name` must be a string of the form `"your_script_name.py"`, received {script_name}.')
+		path_to_lock_file = self.path_to_measurement_base_directory/Path(f'{LOCK_FILE_NAME_PREFIX}{script_name.replace(".py","")}')
+		return path_to_lock_file.is_file() and not _lock_is_stale(path_to_lock_file, stale_after=self.LOCK_STALE_AFTER)
 	
 	@property
 	def measurement_name(self) -> str:
 		"""Returns a string with the measurement name."""
-		return self.path_to_measurement_base_directory.resolve().parts[-1]
+		if hasattr(self, '_archive'):
+			return self.path_to_measurement_base_directory.name
+		if getattr(self, '_measurement_name_of', None) != self.path_to_measurement_base_directory: # `resolve` is slow, and the path may change while creating a new measurement.
+			self._measurement_name = self.path_to_measurement_base_directory.resolve().parts[-1]
+			self._measurement_name_of = self.path_to_measurement_base_directory
+		return self._measurement_name
 	
 	@property
 	def birth_datetime(self) -> datetime.datetime:
@@ -188,6 +1507,54 @@ bureaucrat = Bureaucrat(
 		if there were any."""
 		return self.path_to_default_output_directory/Path('submeasurements')
 	
+	@property
+	def measurements_tree_index(self) -> MeasurementsTreeIndex:
+		"""The `MeasurementsTreeIndex` of the tree to which this measurement
+		belongs, or `None` if such tree has no index."""
+		if hasattr(self, '_archive'): # Archives have their own index.
+			return None
+		if getattr(self, '_measurements_tree_index', None) is None: # Once it is found it is kept, but if it is not found we keep looking because it may be created later on.
+			self._measurements_tree_index = MeasurementsTreeIndex.of_measurement(self.path_to_measurement_base_directory)
+		return self._measurements_tree_index
+	
+	def rebuild_index(self) -> MeasurementsTreeIndex:
+		"""Creates (or re-creates, if it already existed) the index of the
+		tree to which this measurement belongs by walking the whole tree.
+		Use this for trees that were created by older bureaucrats or that
+		were modified by hand. Returns the index."""
+		index = MeasurementsTreeIndex(find_root_measurement(self.path_to_measurement_base_directory))
+		index.rebuild()
+		self._measurements_tree_index = index
+		return index
+	
+	def verify_index(self) -> bool:
+		"""Returns `True` if the index of the tree to which this measurement
+		belongs agrees with what is in the file system, `False` if it does
+		not or if there is no index."""
+		index = self.measurements_tree_index
+		return index is not None and index.verify()
+	
+	def find_measurements_with_parameters(self, task_name:str=None, **conditions) -> list:
+		"""Searches the index of the tree for the measurements, within this
+		one and its submeasurements (and their submeasurements, etc.), in
+		which a task was run with local variables that fulfill all the 
+		conditions. Only the local variables that are numbers or strings 
+		are considered. For example
+		```
+		John.find_measurements_with_parameters(task_name='measure', n_steps=5, voltage=('>', 10))
+		```
+		returns a list with the paths of the measurements in which the task
+		`measure` was run with `n_steps == 5` and `voltage > 10`. The 
+		operators are `'=='`, `'!='`, `'<'`, `'<='`, `'>'`, `'>='` and
+		`'in'`, e.g. `n_steps=('in', [5,6,7])`.
+		
+		The tree has to have an index, use `rebuild_index` for trees created
+		by older bureaucrats.
+		"""
+		if self.measurements_tree_index is None:
+			raise RuntimeError(f'The tree of measurement {repr(self.measurement_name)} has no index, use `rebuild_index` to create it.')
+		return self.measurements_tree_index.find_measurements(conditions, task_name=task_name, within=self.path_to_measurement_base_directory)
+	
 	def find_all_submeasurements(self) -> dict:
 		"""Looks for submeasurements in the current measurement and returns
 		a dictionary with the name of the script pointing to another
@@ -205,17 +1572,18 @@ bureaucrat = Bureaucrat(
 		if `measurement_a` has itself submeasurements, they will not appear
 		here. See the function `find_submeasurements_recursively` for this.
 		"""
-		submeasurements_tree = find_submeasurements_recursively(self.path_to_measurement_base_directory)
+		if hasattr(self, '_archive'):
+			return self._archive.submeasurements_of(self.path_to_measurement_base_directory)
+		index = self.measurements_tree_index
+		if index is not None:
+			return index.submeasurements_of(self.path_to_measurement_base_directory)
 		submeasurements_dict = {}
-		if submeasurements_tree is not None:
-			for top_level in submeasurements_tree: # `find_submeasurements_recursively` returns a tree starting from the top level measurement... This `for` loop only has one iteration.
-				for submeasurement in submeasurements_tree[top_level]:
-					path_to_submeasurement = Path(submeasurement)
-					submeasurement_name = path_to_submeasurement.parts[-1]
-					submeasurement_created_by_script = path_to_submeasurement.parts[-3]
-					if submeasurement_created_by_script not in submeasurements_dict:
-						submeasurements_dict[submeasurement_created_by_script] = dict()
-					submeasurements_dict[submeasurement_created_by_script][submeasurement_name] = path_to_submeasurement
+		for _, path_to_submeasurement in iter_submeasurements(self.path_to_measurement_base_directory, max_depth=1):
+			submeasurement_name = path_to_submeasurement.parts[-1]
+			submeasurement_created_by_script = path_to_submeasurement.parts[-3]
+			if submeasurement_created_by_script not in submeasurements_dict:
+				submeasurements_dict[submeasurement_created_by_script] = dict()
+			submeasurements_dict[submeasurement_created_by_script][submeasurement_name] = path_to_submeasurement
 		return submeasurements_dict
 	
 	def find_submeasurements_of_script(self, script_name:str) -> dict:
@@ -248,22 +1616,14 @@ bureaucrat = Bureaucrat(
 			script_name = self._path_to_the_script_that_created_this_bureaucrat.parts[-1]
 		elif not isinstance(script_name, str) or script_name[-3:] != '.py':
 			raise ValueError(f'`script_name` must be a string of the form `"your_script_name.py"`, received {script_name}.')
-		errors_report_file_path = self.path_to_output_directory_of_script_named(script_name)/Path('SmarterBureaucrat_errors_report.txt')
-		
-		script_was_applied_without_errors = False
-		
-		try:
-			with open(errors_report_file_path, 'r') as ifile:
-				for line in ifile:
-					if 'run_status: no errors' in line:
-						script_was_applied_without_errors = True
-		except FileNotFoundError:
-			pass
-		
-		for fname in {'script_successfully_applied','.script_successfully_applied'}: # Compatibility with older bureaucrats...
-			script_was_applied_without_errors |= (self.path_to_output_directory_of_script_named(script_name)/Path(fname)).is_file()
-		
-		return script_was_applied_without_errors
+		if hasattr(self, '_archive'):
+			return self._archive.task_was_applied_without_errors(self.path_to_measurement_base_directory, script_name.replace('.py',''))
+		index = self.measurements_tree_index
+		if index is not None:
+			run_status = index.run_status(self.path_to_measurement_base_directory, script_name.replace('.py',''))
+			if run_status is not None and run_status != 'running':
+				return run_status == 'no errors'
+		return _read_run_status_from_output_directory(self.path_to_output_directory_of_script_named(script_name))
 	
 	def check_required_scripts_were_run_before(self, script_names:list, raise_error:bool=True) -> bool:
 		"""Given a list of script names, check whether all of them were
@@ -292,7 +1652,11 @@ bureaucrat = Bureaucrat(
 			raise TypeError(f'`script_names` must be a list, received an object of type {type(script_names)}.')
 		were_the_scripts_applied_without_errors = True
 		scripts_that_did_not_run_without_errors = set()
+		if not hasattr(self, '_upstream_manifests'):
+			self._upstream_manifests = dict()
 		for script_name in script_names:
+			if not hasattr(self, '_archive'): # In archives nothing is going to be run, so no need for this.
+				self._upstream_manifests[script_name.replace('.py','')] = manifest_of_output_directory(self.path_to_output_directory_of_script_named(script_name)) # Now, so if the upstream task is run again meanwhile, this run is not considered up to date.
 			if self.script_was_applied_without_errors(script_name) == True:
 				continue
 			were_the_scripts_applied_without_errors &= False
@@ -301,6 +1665,47 @@ bureaucrat = Bureaucrat(
 			raise RuntimeError(f'There is no successfull run of {scripts_that_did_not_run_without_errors} on measurement named `"{self.measurement_name}"` located in {self.path_to_measurement_base_directory}.')
 		return were_the_scripts_applied_without_errors
 	
+	# Versions of the methods above for `asyncio`, all the reading of files is done in a thread so the event loop is never blocked. The threads are those of the default executor of the loop, see `asyncio.loop.set_default_executor`.
+	
+	async def find_all_submeasurements_async(self) -> dict:
+		return await asyncio.to_thread(self.find_all_submeasurements)
+	
+	async def find_submeasurements_of_script_async(self, script_name:str) -> dict:
+		return await asyncio.to_thread(self.find_submeasurements_of_script, script_name)
+	
+	async def script_was_applied_without_errors_async(self, script_name:str=None) -> bool:
+		return await asyncio.to_thread(self.script_was_applied_without_errors, script_name)
+	
+	async def check_required_scripts_were_run_before_async(self, script_names:list, raise_error:bool=True) -> bool:
+		return await asyncio.to_thread(self.check_required_scripts_were_run_before, script_names, raise_error)
+	
+	async def script_is_running_async(self, script_name:str) -> bool:
+		return await asyncio.to_thread(self.script_is_running, script_name)
+	
+	async def run_record_of_script_named_async(self, script_name:str) -> dict:
+		return await asyncio.to_thread(self.run_record_of_script_named, script_name)
+	
+	async def read_input_async(self, fpath:Path, mode:str='r', encoding:str=None):
+		"""Reads the whole file `fpath` without blocking the event loop
+		and returns its contents, a string if `mode` is `'r'` or bytes if
+		`'rb'`. Compressed files are decompressed, see `open_input`."""
+		def read():
+			with self.open_input(fpath, mode=mode, encoding=encoding) as ifile:
+				return ifile.read()
+		return await asyncio.to_thread(read)
+	
+	async def write_output_async(self, file_name:str, data, compression:str=None, **kwargs):
+		"""Writes `data`, a string or bytes, into the file `file_name` in 
+		the default output directory without blocking the event loop.
+		`compression` and `**kwargs` are as in `open_output`, by default
+		nothing is compressed."""
+		if not isinstance(data, (str, bytes, bytearray, memoryview)):
+			raise TypeError(f'`data` must be a string or bytes, received object of type {type(data)}.')
+		def write():
+			with self.open_output(file_name, mode='w' if isinstance(data, str) else 'wb', compression=compression, **kwargs) as ofile:
+				ofile.write(data)
+		await asyncio.to_thread(write)
+	
 	def path_to_output_directory_of_script_named(self, script_name:str) -> Path:
 		"""Returns the path to the directory where another script named 
 		`script_name` that was run before on the same measurement was 
@@ -315,33 +1720,350 @@ bureaucrat = Bureaucrat(
 			raise ValueError(f'`script_name` must be a string of the form `"your_script_name.py"`, received {script_name}.')
 		return self.path_to_measurement_base_directory/Path(script_name.replace(".py",""))
 	
-	def clean_default_output_directory(self):
-		"""Deletes all content in the default output directory."""
-		for p in self.path_to_default_output_directory.iterdir():
-			if p.is_file():
-				p.unlink()
-			elif p.is_dir():
-				rmtree(p)
+	def run_record_of_script_named(self, script_name:str) -> dict:
+		"""Returns the run record (see `read_run_record`) of the last run
+		of the script named `script_name` on the current measurement, or
+		`None` if there is no such record."""
+		return read_run_record(self.path_to_output_directory_of_script_named(script_name))
 	
-	def _make_backup_of_calling_script_file(self, _locals:dict, fpath:Path):
-		"""Creates a backup of the script in which this bureaucrat was
-		created, and stores it in the default output directory.
+	def memory_map_output_of_script_named(self, script_name:str, file_name:str):
+		"""Gives access to a file in the output directory of the script 
+		named `script_name` without reading it into memory, so that only
+		the parts that are used are read from the disk. This is much faster
+		than parsing text for big data, e.g. thousands of waveforms.
+		
+		Parameters
+		----------
+		script_name: str
+			Name of the script that produced the file.
+		file_name: str
+			Name of the file within the output directory of the script.
+		
+		Returns
+		-------
+		data:
+			- For `.npy` files (e.g. written with `numpy.save`), a read only
+			`numpy.memmap`.
+			- For files written with `chunked_writer`, a `MappedChunkedArrays`
+			with the arrays in it.
+			- For any other file, a read only `memoryview` of its bytes,
+			which can be turned into an array with `numpy.frombuffer`.
 		"""
-		with fpath.open('w') as ofile:
-			print(f'# This is an automatic copy of the script that processed the data in this directory.', file = ofile)
-			print(f'# The script original location was {self._path_to_the_script_that_created_this_bureaucrat}', file = ofile)
-			print(f'# This backup was created on {datetime.datetime.now()}.', file = ofile)
-			print(f'# The local variables in the script at the moment this copy was made were:', file = ofile)
-			for key in _locals:
-				print(f'# {key}: {repr(_locals[key])}', file = ofile)
-			print(f'# -----------------------------------', file = ofile)
-			with self._path_to_the_script_that_created_this_bureaucrat.open('r') as ifile:
+		if not isinstance(file_name, str):
+			raise TypeError(f'`file_name` must be an instance of {str}, received object of type {type(file_name)}.')
+		if hasattr(self, '_archive'):
+			raise RuntimeError(f'Files in archives cannot be memory mapped, use `unpack_measurement` or read them with `.open()`.')
+		fpath = self.path_to_output_directory_of_script_named(script_name)/Path(file_name)
+		with open(fpath, 'rb') as ifile:
+			magic = ifile.read(len(CHUNKED_FILE_MAGIC))
+			if magic == CHUNKED_FILE_MAGIC:
+				return MappedChunkedArrays(fpath)
+			if magic == b'\x93NUM': # Beginning of `.npy` files.
+				import numpy # If we are here, it is because there is a NumPy file.
+				return numpy.load(fpath, mmap_mode='r', allow_pickle=False)
+			if os.fstat(ifile.fileno()).st_size == 0: # An empty file cannot be mapped.
+				return memoryview(b'')
+			return memoryview(mmap.mmap(ifile.fileno(), 0, access=mmap.ACCESS_READ))
+	
+	def resumable_sweep(self, sweep_points, key=repr):
+		"""Iterates over `sweep_points` keeping a journal of the points that
+		were already done in the output directory, so if the script crashes
+		it can be run again and it continues where it was. Use it like this:
+		```
+		John = NamedTaskBureaucrat(path, task_name='sweep', _locals=locals(), new_measurement=True)
+		with John.do_your_magic():
+			for k in John.resumable_sweep(range(20000)):
+				Rick = John.create_submeasurement(f'variable_value_{k}', task_name='measure', _locals={'k': k})
+				with Rick.do_your_magic():
+					measure(Rick.path_to_default_output_directory)
+		```
+		and if it crashes, to resume use the path to the measurement that 
+		was created (not a new one) and do not clean the output directory:
+		```
+		John = NamedTaskBureaucrat(path_to_the_crashed_measurement, task_name='sweep', _locals=locals())
+		with John.do_your_magic(clean_default_output_directory=False):
+			for k in John.resumable_sweep(range(20000)): # This will skip all the points done before the crash.
+				...
+		```
+		A point is considered done when the body of the `for` loop finishes
+		for it, i.e. when the next point is requested, so a point that
+		raised an error is not done.
+		
+		Parameters
+		----------
+		sweep_points: iterable
+			The points to iterate over.
+		key: callable, default `repr`
+			A function that receives a point and returns a string that 
+			identifies it in the journal.
+		"""
+		if not callable(key):
+			raise TypeError(f'`key` must be callable, received object of type {type(key)}.')
+		if not hasattr(self, '_datetime_magic_started') or hasattr(self, '_already_did_my_job'):
+			raise RuntimeError(f'`resumable_sweep` can only be used while the bureaucrat is doing its magic, i.e. inside `with {type(self).__name__}.do_your_magic():`.')
+		path_to_journal = self.path_to_default_output_directory/Path(PROGRESS_JOURNAL_FILE_NAME)
+		points_already_done = set()
+		try:
+			with open(path_to_journal, 'r') as ifile:
 				for line in ifile:
-					line = line.replace("\n","").replace("\r","")
-					print(line, file = ofile)
+					try:
+						points_already_done.add(json.loads(line))
+					except json.JSONDecodeError: # The last line may be incomplete if it crashed while writing it.
+						pass
+		except FileNotFoundError:
+			pass
+		with open(path_to_journal, 'a') as journal:
+			for point in sweep_points:
+				point_key = key(point)
+				if point_key in points_already_done:
+					continue
+				yield point
+				if self.measurements_tree_index is not None: # Submeasurements of the points done must be in the index before the journal says so, see `batch_index_writes` in `create_submeasurement`.
+					self.measurements_tree_index.flush()
+				print(json.dumps(point_key), file=journal)
+				journal.flush()
+				os.fsync(journal.fileno()) # So it survives even if the computer crashes.
+	
+	def chunked_writer(self, file_name:str, **kwargs) -> ChunkedWriter:
+		"""Returns a `ChunkedWriter` that writes into a file in the default
+		output directory, to store the data while it is being measured
+		instead of keeping it in memory until the end. It is closed and 
+		validated automatically when the bureaucrat finishes its magic.
+		Example:
+		```
+		with John.do_your_magic():
+			waveforms = John.chunked_writer('waveforms', background=True)
+			for k in range(99999):
+				waveforms.append_array(oscilloscope.get_waveform())
+		```
+		
+		Parameters
+		----------
+		file_name: str
+			Name of the file, it is created in the default output directory.
+		**kwargs:
+			Passed to `ChunkedWriter`, e.g. `background=True`.
+		"""
+		if not isinstance(file_name, str):
+			raise TypeError(f'`file_name` must be an instance of {str}, received object of type {type(file_name)}.')
+		if not hasattr(self, '_datetime_magic_started') or hasattr(self, '_already_did_my_job'):
+			raise RuntimeError(f'`chunked_writer` can only be used while the bureaucrat is doing its magic, i.e. inside `with {type(self).__name__}.do_your_magic():`.')
+		writer = ChunkedWriter(self.path_to_default_output_directory/Path(file_name), **kwargs)
+		if not hasattr(self, '_chunked_writers'):
+			self._chunked_writers = []
+		self._chunked_writers.append(writer)
+		return writer
+	
+	def _close_chunked_writers(self):
+		"""Closes all the writers created by `chunked_writer`, even if some
+		of them fail, and re-raises the first error."""
+		first_error = None
+		for writer in getattr(self, '_chunked_writers', []):
+			try:
+				writer.close()
+			except Exception as e:
+				if first_error is None:
+					first_error = e
+		self._chunked_writers = []
+		if first_error is not None:
+			raise first_error
+	
+	def open_output(self, file_name:str, mode:str='w', compression:str='gzip', **kwargs):
+		"""Opens a file in the default output directory for writing, which
+		is compressed transparently while it is written. The compression
+		is done in blocks by a pool of threads, so big files are written
+		almost as fast as without compression. Example:
+		```
+		with John.do_your_magic():
+			with John.open_output('measured_data.csv') as ofile: # Creates `measured_data.csv.gz`.
+				print('voltage,current', file=ofile)
+				...
+		```
+		The file can be read by any other tool (e.g. `gunzip`) or with
+		`open_input`, which detects the compression automatically.
+		
+		Parameters
+		----------
+		file_name: str
+			Name of the file, it is created in the default output directory.
+			The extension of the compression (e.g. `.gz`) is appended, 
+			unless it is already there.
+		mode: str, default `'w'`
+			`'w'` for text or `'wb'` for bytes.
+		compression: str, default `'gzip'`
+			One of `'gzip'`, `'bz2'`, `'lzma'`, `'zstd'` (faster, requires
+			the `zstandard` package) or `None` for no compression.
+		**kwargs:
+			Passed to `BlockCompressedWriter`, e.g. `level` or `max_workers`,
+			and `encoding` for text files.
+		
+		Returns
+		-------
+		ofile:
+			A file object, use it in a `with` statement.
+		"""
+		if not isinstance(file_name, str):
+			raise TypeError(f'`file_name` must be an instance of {str}, received object of type {type(file_name)}.')
+		if hasattr(self, '_archive'):
+			raise RuntimeError(f'Archives are read only.')
+		if compression is None:
+			if mode not in {'w', 'wt', 'wb'}:
+				raise ValueError(f'`mode` must be one of `"w"`, `"wt"` or `"wb"`, received {repr(mode)}.')
+			return open(self.path_to_default_output_directory/Path(file_name), mode, encoding=kwargs.get('encoding'))
+		if compression not in COMPRESSIONS:
+			raise ValueError(f'`compression` must be one of {sorted(COMPRESSIONS)} or `None`, received {repr(compression)}.')
+		if not file_name.endswith(COMPRESSIONS[compression]['extension']):
+			file_name += COMPRESSIONS[compression]['extension']
+		return open_compressed_for_writing(self.path_to_default_output_directory/Path(file_name), mode=mode, compression=compression, **kwargs)
+	
+	def open_input(self, fpath:Path, mode:str='r', encoding:str=None):
+		"""Opens a file for reading, e.g. the output of another task, and
+		decompresses it transparently if it was compressed (with `open_output`
+		or in any other way), the compression is detected automatically.
+		If the file does not exist but a compressed version of it does,
+		that one is opened. Example:
+		```
+		with Paul.open_input(Paul.path_to_output_directory_of_task_named('measure')/'measured_data.csv') as ifile: # Finds `measured_data.csv.gz`.
+			data = pandas.read_csv(ifile)
+		```
+		
+		Parameters
+		----------
+		fpath: Path
+			Path to the file, it also works with paths within archives.
+		mode: str, default `'r'`
+			`'r'` for text or `'rb'` for bytes.
+		encoding: str, optional
+			Encoding for text files.
+		"""
+		if not isinstance(fpath, (Path, zipfile.Path)):
+			raise TypeError(f'`fpath` must be an instance of {Path}, received object of type {type(fpath)}.')
+		return open_compressed_for_reading(fpath, mode=mode, encoding=encoding)
+	
+	def clean_default_output_directory(self, in_background:bool=False):
+		"""Deletes all content in the default output directory.
+		
+		Parameters
+		----------
+		in_background: bool, default `False`
+			If `True`, the output directory is renamed into the directory
+			`SmarterBureaucrat_trash` of the measurement and a new empty 
+			one is created in its place, which takes no time. Then a 
+			background thread deletes the trash, including leftovers of
+			previous runs that did not finish deleting it. Use 
+			`cleanup_is_pending` and `wait_for_cleanup` to know when
+			it is done. Python waits for the deletion to finish before 
+			exiting.
+		"""
+		if in_background == True:
+			path_to_trash_directory = self.path_to_measurement_base_directory/Path(TRASH_DIRECTORY_NAME)
+			path_to_trash_directory.mkdir(exist_ok=True)
+			os.rename(self.path_to_default_output_directory, path_to_trash_directory/Path(f'{self.path_to_default_output_directory.name}_{datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")}_{os.getpid()}'))
+			self.path_to_default_output_directory.mkdir()
+			self._cleanup_thread = threading.Thread(target=_empty_trash_directory, args=(path_to_trash_directory,)) # Not a daemon, so Python waits for it.
+			self._cleanup_thread.start()
+		else:
+			for p in self.path_to_default_output_directory.iterdir():
+				if p.is_file():
+					p.unlink()
+				elif p.is_dir():
+					rmtree(p)
+		if self.measurements_tree_index is not None:
+			self.measurements_tree_index.forget_submeasurements_of_task(self.path_to_measurement_base_directory, self.path_to_default_output_directory.name)
+	
+	@property
+	def cleanup_is_pending(self) -> bool:
+		"""`True` if there is a cleanup of the output directory running
+		in the background, see `clean_default_output_directory`."""
+		return hasattr(self, '_cleanup_thread') and self._cleanup_thread.is_alive()
+	
+	def wait_for_cleanup(self, timeout:float=None) -> bool:
+		"""Waits for a cleanup of the output directory running in the 
+		background, see `clean_default_output_directory`, to finish.
+		Returns `True` if it finished, `False` if `timeout` (in seconds)
+		expired first."""
+		if hasattr(self, '_cleanup_thread'):
+			self._cleanup_thread.join(timeout=timeout)
+		return not self.cleanup_is_pending
+	
+	def _make_backup_of_calling_script_file(self, fpath:Path):
+		"""Creates a backup of the script in which this bureaucrat was
+		created, including the local variables, and stores it in `fpath`.
+		"""
+		lines = [
+			f'# This is an automatic copy of the script that processed the data in this directory.',
+			f'# The script original location was {self._path_to_the_script_that_created_this_bureaucrat}',
+			f'# This backup was created on {datetime.datetime.now()}.',
+			f'# The local variables in the script at the moment this copy was made were:',
+		]
+		lines += [f'# {key}: {value}' for key,value in self._locals_reprs.items()]
+		lines.append(f'# -----------------------------------')
+		with self._path_to_the_script_that_created_this_bureaucrat.open('r') as ifile:
+			script = ifile.read().replace("\r","")
+		if len(script) > 0 and script[-1] != '\n':
+			script += '\n'
+		_write_text_atomically('\n'.join(lines) + '\n' + script, fpath) # A single write is much faster than many small ones, especially in network file systems. It also replaces a backup from a previous run instead of writing into it, which may be a hard link to a stored backup, see `deduplicate_script_backup`.
+	
+	def _script_sha256(self) -> str:
+		if not hasattr(self, '_script_sha256_cache'):
+			self._script_sha256_cache = hashlib.sha256(self._path_to_the_script_that_created_this_bureaucrat.read_bytes()).hexdigest()
+		return self._script_sha256_cache
+	
+	def _fingerprint(self, upstream_manifests:dict) -> dict:
+		"""Returns a dictionary that identifies the inputs of this run: the
+		script, the local variables that can be stored as JSON (a SHA-256
+		for each of them) and the manifest of the output of each upstream
+		task (see `manifest_of_output_directory`)."""
+		if not hasattr(self, '_locals_sha256'):
+			self._locals_sha256 = _sha256_of_each_jsonable_local(_jsonable_locals(self._locals, max_length=self.LOCALS_FILE_MAX_LENGTH))
+		return {
+			'script_sha256': self._script_sha256(),
+			'locals_sha256': self._locals_sha256,
+			'upstream_manifests': upstream_manifests,
+		}
+	
+	def _store_deduplicated_backup_of_calling_script_file(self) -> Path:
+		"""Stores a copy of the script in which this bureaucrat was created
+		in the scripts backups directory of the top level measurement, 
+		unless an identical one is already there. Returns the path to it.
+		"""
+		if not hasattr(self, '_path_to_stored_script_backup'):
+			script_contents = self._path_to_the_script_that_created_this_bureaucrat.read_bytes()
+			self._script_sha256_cache = hashlib.sha256(script_contents).hexdigest()
+			path_to_scripts_backups_directory = find_root_measurement(self.path_to_measurement_base_directory)/Path(SCRIPTS_BACKUPS_DIRECTORY_NAME)
+			path_to_stored_backup = path_to_scripts_backups_directory/Path(f'{self._script_sha256_cache}.{self._path_to_the_script_that_created_this_bureaucrat.parts[-1]}')
+			if not path_to_stored_backup.is_file():
+				path_to_scripts_backups_directory.mkdir(exist_ok=True)
+				path_to_temporary_file = path_to_scripts_backups_directory/Path(f'.{path_to_stored_backup.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+				path_to_temporary_file.write_bytes(script_contents)
+				os.replace(path_to_temporary_file, path_to_stored_backup) # Many bureaucrats may be doing this at the same time, but they all write the same.
+			self._path_to_stored_script_backup = path_to_stored_backup
+		return self._path_to_stored_script_backup
+	
+	def _link_deduplicated_backup_of_calling_script_file(self) -> str:
+		"""Links the stored backup of the script (see `_store_deduplicated_backup_of_calling_script_file`)
+		from the default output directory. Returns the SHA-256 of the script.
+		"""
+		path_to_stored_backup = self._store_deduplicated_backup_of_calling_script_file()
+		path_to_backup = self.path_to_default_output_directory/Path(self._backup_script_file_name)
+		path_to_pointer_file = path_to_backup.parent/Path(f'{path_to_backup.name}.pointer.txt')
+		path_to_temporary_link = path_to_backup.parent/Path(f'.{path_to_backup.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+		path_to_temporary_link.unlink(missing_ok=True)
+		try:
+			os.link(path_to_stored_backup, path_to_temporary_link)
+		except OSError as e:
+			if e.errno not in {errno.EPERM, errno.EXDEV, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP}: # Only if the file system does not support hard links, or not between these directories.
+				raise
+			path_to_backup.unlink(missing_ok=True) # It would be the backup of a previous run.
+			_write_text_atomically(f'The backup of the script that processed the data in this directory is {path_to_stored_backup}\nsha256: {self._script_sha256()}\n', path_to_pointer_file)
+		else:
+			os.replace(path_to_temporary_link, path_to_backup) # A backup of a previous run is replaced, not written into, so the stored backup it may be linked to is not touched.
+			path_to_temporary_link.unlink(missing_ok=True) # If both were already links to the same file, `os.replace` does nothing.
+			path_to_pointer_file.unlink(missing_ok=True)
+		return self._script_sha256()
 
 class NamedTaskBureaucrat(SmarterBureaucrat):
-	def __init__(self, measurement_base_path:Path, task_name:str, _locals:dict=None, new_measurement=False):
+	def __init__(self, measurement_base_path:Path, task_name:str, _locals:dict=None, new_measurement=False, deduplicate_script_backup:bool=False):
 		"""Create an instance of `Bureaucrat`.
 		
 		Parameters
@@ -365,21 +2087,23 @@ class NamedTaskBureaucrat(SmarterBureaucrat):
 			created in the past, for example you will now analyze this 
 			data with another script. If `True` then a new directory
 			will be created as the root directory for a new measurement.
+		deduplicate_script_backup: bool, default `False`
+			If `True`, the backup of the script is stored only once per
+			content in the directory `SmarterBureaucrat_scripts_backups`
+			of the top level measurement and the output directory gets 
+			a hard link to it (or a small pointer file if hard links are
+			not possible). The local variables are then stored in the 
+			run record instead of in the backup. Use this for scripts that
+			create many submeasurements, to avoid thousands of identical
+			files.
 		"""
-		super().__init__(measurement_base_path=measurement_base_path, _locals=_locals, new_measurement=new_measurement)
+		super().__init__(measurement_base_path=measurement_base_path, _locals=_locals, new_measurement=new_measurement, deduplicate_script_backup=deduplicate_script_backup)
 		
 		if not isinstance(task_name, str):
 			raise ValueError(f'`task_name` must be an object of type {str}, received object of type {type(task_name)}.')
 		if len(set(task_name) - NICE_CHARACTERS_FOR_FILE_AND_DIRECTORY_NAMES) != 0:
 			warnings.warn(f'Your task name `{task_name}` contains the characters {set(task_name) - NICE_CHARACTERS_FOR_FILE_AND_DIRECTORY_NAMES} which are better to avoid for directory names.')
 		self._task_name = task_name
-		
-		self._path_to_the_script_that_created_this_bureaucrat = Path.cwd()/Path(inspect.currentframe().f_back.f_code.co_filename)
-		self._backup_script_file_name = f'backup.{self._path_to_the_script_that_created_this_bureaucrat.parts[-1]}'
-		self._make_backup_of_calling_script_file(
-			_locals = _locals, 
-			fpath = self.path_to_temporary_directory/Path(self._backup_script_file_name),
-		)
 	
 	@property
 	def task_name(self) -> str:
@@ -408,9 +2132,354 @@ class NamedTaskBureaucrat(SmarterBureaucrat):
 	def path_to_output_directory_of_task_named(self, task_name:str) -> Path:
 		return self.path_to_output_directory_of_script_named(script_name=f'{task_name}.py')
 	
+	def run_record_of_task_named(self, task_name:str) -> dict:
+		return self.run_record_of_script_named(script_name=f'{task_name}.py')
+	
+	def memory_map_output_of_task_named(self, task_name:str, file_name:str):
+		return self.memory_map_output_of_script_named(script_name=f'{task_name}.py', file_name=file_name)
+	
+	def task_is_running(self, task_name:str=None) -> bool:
+		if task_name is None:
+			task_name = self._task_name
+		return self.script_is_running(script_name=f'{task_name}.py')
+	
+	def is_up_to_date(self, ignore_locals:list=None) -> bool:
+		"""Checks whether the last run of this task on this measurement 
+		ended without errors and was done with the same script, the same
+		local variables (those that can be stored as JSON) and the same
+		output of the upstream tasks (those that were checked with 
+		`check_required_tasks_were_run_before`) that there are now. 
+		If so, running the task again would produce the same result.
+		For example
+		```
+		if force == False and John.is_up_to_date(ignore_locals=['force']):
+			return
+		```
+		is like `task_was_applied_without_errors` but it also reruns the
+		tasks whose script, parameters or input data changed, like `make`.
+		
+		Parameters
+		----------
+		ignore_locals: list of str, optional
+			Names of local variables that do not change the result, e.g.
+			flags like `force` or `verbose`, so they are not compared.
+		"""
+		if isinstance(ignore_locals, str):
+			ignore_locals = [ignore_locals]
+		ignore_locals = set(ignore_locals or [])
+		run_record = self.run_record_of_task_named(self.task_name)
+		if run_record is None or run_record['run_status'] != 'no errors' or run_record.get('fingerprint') is None:
+			return False
+		stored = run_record['fingerprint']
+		upstream_manifests = {task_name: manifest_of_output_directory(self.path_to_output_directory_of_task_named(task_name)) for task_name in stored['upstream_manifests']}
+		current = self._fingerprint(upstream_manifests)
+		if stored['script_sha256'] != current['script_sha256'] or stored['upstream_manifests'] != current['upstream_manifests']:
+			return False
+		return {key: sha256 for key, sha256 in stored['locals_sha256'].items() if key not in ignore_locals} == {key: sha256 for key, sha256 in current['locals_sha256'].items() if key not in ignore_locals}
+	
 	def check_required_tasks_were_run_before(self, task_names:list, raise_error:bool=True) -> bool:
 		if isinstance(task_names, str): # This is to make it more practical...
 			task_names = [task_names]
 		if not isinstance(task_names, (list, set)):
 			raise TypeError(f'`task_names` must be a list of strings, received object of type {type(task_names)}.')
 		return self.check_required_scripts_were_run_before(script_names = [f'{task_name}.py' for task_name in task_names], raise_error=raise_error)
+	
+	async def find_submeasurements_of_task_async(self, task_name:str) -> dict:
+		return await asyncio.to_thread(self.find_submeasurements_of_task, task_name)
+	
+	async def task_was_applied_without_errors_async(self, task_name:str=None) -> bool:
+		return await asyncio.to_thread(self.task_was_applied_without_errors, task_name)
+	
+	async def check_required_tasks_were_run_before_async(self, task_names:list, raise_error:bool=True) -> bool:
+		return await asyncio.to_thread(self.check_required_tasks_were_run_before, task_names, raise_error)
+	
+	async def task_is_running_async(self, task_name:str=None) -> bool:
+		return await asyncio.to_thread(self.task_is_running, task_name)
+	
+	async def run_record_of_task_named_async(self, task_name:str) -> dict:
+		return await asyncio.to_thread(self.run_record_of_task_named, task_name)
+	
+	async def is_up_to_date_async(self, ignore_locals:list=None) -> bool:
+		return await asyncio.to_thread(self.is_up_to_date, ignore_locals)
+	
+	async def create_submeasurement_async(self, measurement_name:str, task_name:str, _locals:dict=None, batch_index_writes:bool=False):
+		"""Same as `create_submeasurement`, which reads the script the 
+		first time, for `asyncio`."""
+		return await asyncio.to_thread(self.create_submeasurement, measurement_name, task_name, _locals, batch_index_writes)
+	
+	def create_submeasurement(self, measurement_name:str, task_name:str, _locals:dict=None, batch_index_writes:bool=False):
+		"""Creates a bureaucrat for a new submeasurement of the current
+		measurement, to be used in the same script. This is much faster
+		than creating a new `NamedTaskBureaucrat` for each submeasurement
+		because the child reuses everything its parent already did: the
+		script is not inspected nor read again, its backup is a hard link
+		to the one stored by the parent (see `deduplicate_script_backup`),
+		and the temporary directory is shared. The child does not write 
+		a run record while running, only at the end, nor a `README.md`.
+		Example:
+		```
+		with John.do_your_magic():
+			for k in range(99999):
+				Rick = John.create_submeasurement(f'variable_value_{k}', task_name='measure', _locals={'k': k})
+				with Rick.do_your_magic():
+					measure(Rick.path_to_default_output_directory)
+		```
+		
+		Parameters
+		----------
+		measurement_name: str
+			The name for the submeasurement, the timestamp is prepended
+			just as with `new_measurement=True`.
+		task_name: str
+			The name of the task that the child bureaucrat will handle.
+		_locals: dict, optional
+			The variables to record for the submeasurement, e.g. the 
+			value of the variable being swept. 
+		batch_index_writes: bool, default `False`
+			The child is always added to the index when it starts. If 
+			`True`, its final run status is written into the index later,
+			together with those of the other children in a single 
+			transaction, which is faster (see `MeasurementsTreeIndex.register_task`).
+			Until then, which is at most 1 second or 1000 children later,
+			the index says that it is still running, so its status is 
+			read from its directory (slower), and if the process crashes
+			it stays like that until the index is rebuilt (see 
+			`rebuild_index`). `resumable_sweep` writes them before 
+			recording each point as done.
+		
+		Returns
+		-------
+		child: NamedTaskBureaucrat
+			The bureaucrat for the new submeasurement.
+		"""
+		if not isinstance(measurement_name, str):
+			raise TypeError(f'`measurement_name` must be an instance of {str}, received object of type {type(measurement_name)}.')
+		if not isinstance(task_name, str):
+			raise TypeError(f'`task_name` must be an instance of {str}, received object of type {type(task_name)}.')
+		if not hasattr(self, '_datetime_magic_started') or hasattr(self, '_already_did_my_job'):
+			raise RuntimeError(f'Submeasurements can only be created while the bureaucrat is doing its magic, i.e. inside `with {type(self).__name__}.do_your_magic():`.')
+		if hasattr(self, '_path_to_published_output_directory'):
+			raise RuntimeError(f'Submeasurements cannot be created while staging the output locally, see `stage_locally` in `do_your_magic`.')
+		child = NamedTaskBureaucrat.__new__(NamedTaskBureaucrat) # Skip `__init__`, we already know everything.
+		child._datetime_bureaucrat_was_born = datetime.datetime.now()
+		child._path_to_the_script_that_created_this_bureaucrat = self._path_to_the_script_that_created_this_bureaucrat
+		child._new_measurement = True
+		child._requested_measurement_base_path = self.path_to_submeasurements_directory/Path(measurement_name)
+		child._measurement_base_path = _timestamped_path(child._requested_measurement_base_path, child.birth_datetime)
+		child._backup_script_file_name = self._backup_script_file_name
+		child._deduplicate_script_backup = True
+		child._path_to_stored_script_backup = self._store_deduplicated_backup_of_calling_script_file()
+		child._script_sha256_cache = self._script_sha256()
+		self.path_to_temporary_directory # Make sure it exists, so it is shared.
+		child._temporary_directory = self._temporary_directory
+		child._locals = dict() if _locals is None else dict(_locals)
+		child._task_name = task_name
+		child._measurements_tree_index = self.measurements_tree_index
+		child._is_light_submeasurement = True
+		child._batch_index_writes = batch_index_writes
+		return child
+	
+	def gather_from_submeasurements(self, task_name:str, file_name:str, loader='text', submeasurements_of_task:str=None, skip_missing:bool=False, max_workers:int=32, cache:bool=False):
+		"""Reads a file produced by the task `task_name` in each of the
+		submeasurements of the current measurement, reading many files at 
+		the same time (which is much faster in network file systems), and
+		combines them. This replaces the
+		```
+		values = []
+		for submeasurement_name, path in Paul.find_submeasurements_of_task(...).items():
+			with open(path/Path('process_measurement/processed_data.txt'), 'r') as ifile:
+				values.append(...)
+		```
+		pattern by
+		```
+		values = Paul.gather_from_submeasurements('process_measurement', 'processed_data.txt', loader='numpy')
+		```
+		
+		Parameters
+		----------
+		task_name: str
+			The name of the task that produced the file.
+		file_name: str
+			Path to the file, relative to the output directory of `task_name`.
+		loader: str or callable, default `'text'`
+			How to read each file. One of `'text'` (gives a string), `'csv'`
+			(gives a `pandas.DataFrame`, or a list of dictionaries if pandas
+			is not installed), `'numpy'` (gives a NumPy array, with `numpy.load`
+			for `.npy` files and `numpy.loadtxt` otherwise) or a function
+			that receives the path to the file and returns whatever you want.
+		submeasurements_of_task: str, optional
+			If given, only the submeasurements created by this task are
+			considered. Otherwise all the submeasurements are considered.
+		skip_missing: bool, default `False`
+			If `True`, submeasurements in which the file does not exist are
+			skipped. If `False`, a `FileNotFoundError` is raised.
+		max_workers: int, default 32
+			Number of files read at the same time.
+		cache: bool, default `False`
+			If `True`, the result is stored in the directory `SmarterBureaucrat_gather_cache`
+			of the current measurement and used the next time, unless
+			the file or the run record of `task_name` changed in any of
+			the submeasurements, or submeasurements were added or removed.
+			When `loader` is a function, it is identified by its name, so
+			do not use different functions with the same name (e.g. two
+			`lambda`).
+		
+		Returns
+		-------
+		gathered:
+			- If the loader gives dataframes, a single dataframe with all
+			of them and an extra column `submeasurement_name`.
+			- If the loader gives lists of dictionaries, as `'csv'` without
+			pandas, a single list with all of them and an extra key 
+			`submeasurement_name` in each.
+			- If the loader gives arrays all with the same shape and type,
+			a NumPy structured array with the fields `submeasurement_name`
+			and `value`, e.g. `gathered['value']` is an array with all the
+			arrays stacked.
+			- Otherwise, a dictionary with the submeasurements names as
+			keys and what the loader gave as items.
+		"""
+		if not isinstance(task_name, str):
+			raise TypeError(f'`task_name` must be an instance of {str}, received object of type {type(task_name)}.')
+		if not isinstance(file_name, str):
+			raise TypeError(f'`file_name` must be an instance of {str}, received object of type {type(file_name)}.')
+		if isinstance(loader, str):
+			if loader not in GATHER_LOADERS:
+				raise ValueError(f'`loader` must be one of {sorted(GATHER_LOADERS)} or a function, received {repr(loader)}.')
+			loader_name = loader
+			loader = GATHER_LOADERS[loader]
+		elif callable(loader):
+			loader_name = f'{loader.__module__}.{loader.__qualname__}'
+		else:
+			raise TypeError(f'`loader` must be a string or a function, received object of type {type(loader)}.')
+		if submeasurements_of_task is None:
+			submeasurements = {name: path for submeasurements_dict in self.find_all_submeasurements().values() for name, path in submeasurements_dict.items()}
+		else:
+			submeasurements = self.find_submeasurements_of_task(submeasurements_of_task) or {}
+		submeasurements = dict(sorted(submeasurements.items()))
+		
+		def stamp_of(path_to_submeasurement:Path):
+			# Changes whenever the file or the run of the task changes, without reading them.
+			stamp = []
+			for fpath in [path_to_submeasurement/Path(task_name)/Path(RUN_RECORD_FILE_NAME), path_to_submeasurement/Path(task_name)/Path(file_name)] + [path_to_submeasurement/Path(task_name)/Path(file_name + c['extension']) for c in COMPRESSIONS.values()]:
+				try:
+					stat = os.stat(fpath)
+					stamp.append((stat.st_size, stat.st_mtime_ns))
+				except FileNotFoundError:
+					stamp.append(None)
+			return tuple(stamp)
+		
+		if hasattr(self, '_archive'): # Archives do not change, and we cannot write in them.
+			cache = False
+		with ThreadPoolExecutor(max_workers=max_workers) as executor:
+			if cache == True:
+				path_to_cache = self.path_to_measurement_base_directory/Path(GATHER_CACHE_DIRECTORY_NAME)/Path(hashlib.sha256(repr((task_name, file_name, loader_name, submeasurements_of_task, skip_missing)).encode()).hexdigest() + '.pickle')
+				stamps = dict(zip(submeasurements, executor.map(stamp_of, submeasurements.values())))
+				try:
+					with open(path_to_cache, 'rb') as ifile:
+						cached = pickle.load(ifile)
+					if cached['stamps'] == stamps:
+						return cached['gathered']
+				except (FileNotFoundError, EOFError, pickle.UnpicklingError, KeyError):
+					pass
+			
+			missing = object()
+			def load(path_to_submeasurement:Path):
+				try:
+					return loader(path_to_submeasurement/Path(task_name)/Path(file_name))
+				except FileNotFoundError:
+					if skip_missing:
+						return missing
+					raise
+			gathered = {name: value for name, value in zip(submeasurements, executor.map(load, submeasurements.values())) if value is not missing}
+		gathered = _combine_gathered(gathered)
+		
+		if cache == True:
+			path_to_cache.parent.mkdir(exist_ok=True)
+			with tempfile.NamedTemporaryFile('wb', dir=path_to_cache.parent, delete=False) as ofile:
+				pickle.dump({'stamps': stamps, 'gathered': gathered}, ofile)
+			os.replace(ofile.name, path_to_cache)
+		return gathered
+	
+	def run_on_submeasurements(self, function, task_name:str, submeasurements_of_task:str=None, force:bool=False, max_workers:int=None, progress:bool=True, **kwargs) -> dict:
+		"""Runs `function` on each submeasurement of the current measurement
+		using a pool of processes, i.e. in parallel. This replaces the 
+		```
+		for submeasurement_name, path in Paul.find_submeasurements_of_task(...).items():
+			function(path)
+		```
+		pattern. An error in one submeasurement does not stop the others, 
+		and a summary of the outcome is written into the errors report of
+		this bureaucrat when it finishes its magic.
+		
+		Parameters
+		----------
+		function: callable
+			A function with signature `function(path_to_submeasurement, **kwargs)`
+			that creates its own `NamedTaskBureaucrat` with task name 
+			`task_name` and does its job, just like the `script_core` 
+			functions in the examples. It has to be picklable, which 
+			means that it has to be defined at the top level of a module.
+		task_name: str
+			The name of the task that `function` runs.
+		submeasurements_of_task: str, optional
+			If given, only the submeasurements created by this task are
+			processed. Otherwise all the submeasurements are processed.
+		force: bool, default `False`
+			If `False`, submeasurements on which `task_name` was already
+			applied without errors are skipped.
+		max_workers: int, optional
+			Number of processes, by default what `concurrent.futures.ProcessPoolExecutor`
+			decides.
+		progress: bool, default `True`
+			If `True`, the progress is printed.
+		**kwargs:
+			Passed to `function`.
+		
+		Returns
+		-------
+		outcome: dict
+			A dictionary with the submeasurements names as keys and 
+			`'skipped'`, `'no errors'` or `'there were errors'` as items.
+		"""
+		if not callable(function):
+			raise TypeError(f'`function` must be callable, received object of type {type(function)}.')
+		if not isinstance(task_name, str):
+			raise TypeError(f'`task_name` must be an instance of {str}, received object of type {type(task_name)}.')
+		if submeasurements_of_task is None:
+			submeasurements = {name: path for submeasurements_dict in self.find_all_submeasurements().values() for name, path in submeasurements_dict.items()}
+		else:
+			submeasurements = self.find_submeasurements_of_task(submeasurements_of_task) or {}
+		
+		outcome = {}
+		errors = {}
+		if force == False:
+			statuses = tasks_were_applied_without_errors(submeasurements.values(), [task_name])
+			for name, path in submeasurements.items():
+				if statuses[path][task_name] == True:
+					outcome[name] = 'skipped'
+		to_run = {name: path for name, path in submeasurements.items() if name not in outcome}
+		if progress:
+			print(f'Running task {repr(task_name)} on {len(to_run)} submeasurements ({len(outcome)} skipped because they were already done)...')
+		
+		if len(to_run) > 0:
+			with ProcessPoolExecutor(max_workers=max_workers) as executor:
+				futures = {executor.submit(function, path, **kwargs): name for name, path in to_run.items()}
+				for n_done, future in enumerate(as_completed(futures), start=1):
+					name = futures[future]
+					try:
+						future.result()
+						outcome[name] = 'no errors'
+					except Exception as e:
+						outcome[name] = 'there were errors'
+						errors[name] = e
+					if progress:
+						print(f'{n_done}/{len(to_run)} submeasurements processed, {len(errors)} with errors', end='\n' if n_done == len(to_run) else '\r')
+		
+		summary = f'Task {repr(task_name)} was run on {len(submeasurements)} submeasurements on {datetime.datetime.now()}: {list(outcome.values()).count("no errors")} without errors, {len(errors)} with errors, {list(outcome.values()).count("skipped")} skipped.'
+		for name, e in errors.items():
+			summary += f'\n- {name}: {repr(e)}'
+		if not hasattr(self, '_submeasurements_runs_summaries'):
+			self._submeasurements_runs_summaries = []
+		self._submeasurements_runs_summaries.append(summary)
+		return outcome
@@ -0,0 +1,217 @@
+from pathlib import Path
+import collections
+import queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from bureaucrat.SmarterBureaucrat import iter_submeasurements, tasks_were_applied_without_errors
+
+class TasksScheduler:
+	"""Runs a pipeline of tasks over a whole measurement tree. Each task
+	is a function like the `script_core` functions in the examples, i.e.
+	it receives the path to a measurement, creates a `NamedTaskBureaucrat`
+	and does its job. You tell the scheduler which tasks each task needs
+	to have been run before and it figures out the rest. For example
+	```
+	scheduler = TasksScheduler()
+	scheduler.register_task('process_measurement', process_measurement, upstream_tasks=['measure'])
+	scheduler.register_task('summarize_sweep', summarize_sweep, upstream_tasks_on_submeasurements=['process_measurement'])
+	scheduler.run(Path('/path/to/measurement'))
+	```
+	will run `process_measurement` on each measurement of the tree in which
+	`measure` was run without errors and then `summarize_sweep` on each
+	measurement whose submeasurements were all processed, running in
+	parallel everything that is ready to run.
+	"""
+	def __init__(self):
+		self._tasks = dict()
+	
+	def register_task(self, task_name:str, function, upstream_tasks:list=None, upstream_tasks_on_submeasurements:list=None, **kwargs):
+		"""Adds a task to the pipeline.
+		
+		Parameters
+		----------
+		task_name: str
+			The name of the task, which must be the same as the `task_name`
+			of the `NamedTaskBureaucrat` that `function` creates.
+		function: callable
+			A function with signature `function(path_to_measurement, **kwargs)`
+			that does the task. When using processes it has to be picklable,
+			which means that it has to be defined at the top level of a
+			module.
+		upstream_tasks: list of str, optional
+			Tasks that have to be run without errors on the same
+			measurement before this one. They may be registered tasks
+			or tasks that are not part of the pipeline, e.g. the task that
+			did the measurement.
+		upstream_tasks_on_submeasurements: list of str, optional
+			Tasks that have to be run without errors on each of the
+			submeasurements of a measurement before this one can be run
+			on it.
+		**kwargs:
+			Passed to `function`.
+		"""
+		if not isinstance(task_name, str):
+			raise TypeError(f'`task_name` must be an instance of {str}, received object of type {type(task_name)}.')
+		if task_name in self._tasks:
+			raise ValueError(f'A task named {repr(task_name)} is already registered.')
+		if not callable(function):
+			raise TypeError(f'`function` must be callable, received object of type {type(function)}.')
+		upstream_tasks = [] if upstream_tasks is None else list(upstream_tasks)
+		upstream_tasks_on_submeasurements = [] if upstream_tasks_on_submeasurements is None else list(upstream_tasks_on_submeasurements)
+		self._tasks[task_name] = dict(
+			function = function,
+			upstream_tasks = upstream_tasks,
+			upstream_tasks_on_submeasurements = upstream_tasks_on_submeasurements,
+			kwargs = kwargs,
+		)
+		try:
+			self._check_there_are_no_cycles()
+		except ValueError:
+			del self._tasks[task_name]
+			raise
+	
+	def _check_there_are_no_cycles(self):
+		visiting = set()
+		visited = set()
+		def visit(task_name):
+			if task_name in visited or task_name not in self._tasks:
+				return
+			if task_name in visiting:
+				raise ValueError(f'The task {repr(task_name)} depends on itself.')
+			visiting.add(task_name)
+			for upstream_task in self._tasks[task_name]['upstream_tasks'] + self._tasks[task_name]['upstream_tasks_on_submeasurements']:
+				visit(upstream_task)
+			visiting.remove(task_name)
+			visited.add(task_name)
+		for task_name in self._tasks:
+			visit(task_name)
+	
+	def run(self, measurement_base_path:Path, force:bool=False, max_workers:int=None, use_processes:bool=True, progress:bool=True) -> dict:
+		"""Runs all the registered tasks on all the measurements of the tree
+		of `measurement_base_path` where they can be run.
+		
+		Parameters
+		----------
+		measurement_base_path: Path
+			Path to the measurement from which to start, usually the top
+			level measurement.
+		force: bool, default `False`
+			If `False`, tasks that were already applied without errors
+			are not run again, unless some of their upstream tasks is run.
+			If `True`, everything is run again.
+		max_workers: int, optional
+			Number of workers, by default what `concurrent.futures` decides.
+		use_processes: bool, default `True`
+			If `True` the tasks are run in a pool of processes, otherwise
+			in a pool of threads.
+		progress: bool, default `True`
+			If `True`, the progress is printed.
+		
+		Returns
+		-------
+		outcome: dict
+			A dictionary with `(task_name, path_to_measurement)` as keys
+			and one of `'skipped'` (it was already done), `'no errors'`,
+			`'there were errors'` or `'upstream failed'` (it was not run
+			because some of its upstream tasks ended with errors) as
+			items.
+		"""
+		if not isinstance(measurement_base_path, Path):
+			raise TypeError(f'`measurement_base_path` must be an instance of {Path}, received object of type {type(measurement_base_path)}.')
+		
+		submeasurements = {measurement_base_path: []}
+		for parent, submeasurement in iter_submeasurements(measurement_base_path):
+			submeasurements.setdefault(parent, []).append(submeasurement)
+			submeasurements.setdefault(submeasurement, [])
+		all_task_names = set(self._tasks)
+		for task in self._tasks.values():
+			all_task_names |= set(task['upstream_tasks'] + task['upstream_tasks_on_submeasurements'])
+		statuses = tasks_were_applied_without_errors(submeasurements, all_task_names)
+		
+		# Find the nodes of the graph, i.e. the `(task_name, measurement)` pairs that can be run ---
+		is_node = dict()
+		def check_is_node(task_name, measurement):
+			if (task_name, measurement) not in is_node:
+				is_node[(task_name, measurement)] = False # In case of recursion.
+				task = self._tasks[task_name]
+				is_node[(task_name, measurement)] = \
+					all(check_upstream(upstream_task, measurement) for upstream_task in task['upstream_tasks']) \
+					and (len(task['upstream_tasks_on_submeasurements']) == 0 or len(submeasurements[measurement]) > 0) \
+					and all(check_upstream(upstream_task, s) for upstream_task in task['upstream_tasks_on_submeasurements'] for s in submeasurements[measurement])
+			return is_node[(task_name, measurement)]
+		def check_upstream(upstream_task, measurement):
+			if upstream_task in self._tasks:
+				return check_is_node(upstream_task, measurement)
+			return statuses[measurement][upstream_task]
+		dependencies = dict()
+		for task_name, task in self._tasks.items():
+			for measurement in submeasurements:
+				if check_is_node(task_name, measurement):
+					dependencies[(task_name, measurement)] = [(u, measurement) for u in task['upstream_tasks'] if u in self._tasks] + [(u, s) for u in task['upstream_tasks_on_submeasurements'] if u in self._tasks for s in submeasurements[measurement]]
+		
+		# Decide which nodes have to be run, in topological order ---
+		needs_to_run = dict()
+		def check_needs_to_run(node):
+			if node not in needs_to_run:
+				task_name, measurement = node
+				needs_to_run[node] = force or not statuses[measurement][task_name] or any(check_needs_to_run(d) for d in dependencies[node])
+			return needs_to_run[node]
+		outcome = {node: 'skipped' for node in dependencies if not check_needs_to_run(node)}
+		to_run = {node for node in dependencies if needs_to_run[node]}
+		if progress:
+			print(f'Running {len(to_run)} tasks ({len(outcome)} skipped because they were already done)...')
+		
+		# Run, each node is submitted as soon as all its dependencies ended without errors ---
+		dependents = {node: [] for node in to_run}
+		n_pending_dependencies = dict()
+		for node in to_run:
+			pending_dependencies = {d for d in dependencies[node] if d in to_run} # The others were skipped, i.e. they are done.
+			n_pending_dependencies[node] = len(pending_dependencies)
+			for d in pending_dependencies:
+				dependents[d].append(node)
+		ready = collections.deque(sorted((node for node in to_run if n_pending_dependencies[node] == 0), key=str))
+		n_done = 0
+		def mark_upstream_failed(node):
+			nonlocal n_done
+			nodes = list(dependents[node])
+			while len(nodes) > 0:
+				node = nodes.pop()
+				if node in outcome:
+					continue
+				outcome[node] = 'upstream failed'
+				n_done += 1
+				nodes += dependents[node]
+		Executor = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+		with Executor(max_workers=max_workers) as executor:
+			running = dict()
+			finished = queue.Queue() # Not `concurrent.futures.wait`, which looks at all the running futures each time.
+			def submit_ready_nodes():
+				while len(ready) > 0:
+					node = ready.popleft()
+					if node in outcome: # Some other of its dependencies failed.
+						continue
+					task_name, measurement = node
+					future = executor.submit(self._tasks[task_name]['function'], measurement, **self._tasks[task_name]['kwargs'])
+					running[future] = node
+					future.add_done_callback(finished.put)
+			submit_ready_nodes()
+			while len(running) > 0:
+				future = finished.get()
+				node = running.pop(future)
+				n_done += 1
+				try:
+					future.result()
+					outcome[node] = 'no errors'
+				except Exception as e:
+					outcome[node] = 'there were errors'
+					if progress:
+						print(f'Task {repr(node[0])} ended with errors on {node[1]}: {repr(e)}')
+					mark_upstream_failed(node)
+				else:
+					for dependent in dependents[node]:
+						n_pending_dependencies[dependent] -= 1
+						if n_pending_dependencies[dependent] == 0:
+							ready.append(dependent)
+				submit_ready_nodes()
+				if progress:
+					print(f'{n_done}/{len(to_run)} tasks done', end='\n' if len(running) == 0 else '\r')
+		return outcome
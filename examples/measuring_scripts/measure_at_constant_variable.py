@@ -1,6 +1,5 @@
 from bureaucrat.SmarterBureaucrat import SmarterBureaucrat
 from pathlib import Path
-from time import sleep
 
 def script_core(path, some_variable:int):
 	Rick = SmarterBureaucrat(
@@ -8,7 +7,6 @@ def script_core(path, some_variable:int):
 		_locals = locals(),
 		new_measurement = True,
 	)
-	sleep(1) # This is to avoid multiple measurements with the same timestamp.
 	with Rick.do_your_magic():
 		with (Rick.path_to_default_output_directory/Path('measured_data.txt')).open('w') as ofile:
 			print('Rick measured this!', file=ofile)